@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.clients import supabase_client
+from app.core.clients import get_supabase_client
 from app.schemas.user import UserCreate, UserLogin
 from app.schemas.token import Token
 from app.services.auth_service import AuthService
@@ -7,7 +7,7 @@ from app.services.auth_service import AuthService
 router = APIRouter()
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, auth_service: AuthService = Depends(lambda: AuthService(supabase_client))):
+def register(user_data: UserCreate, auth_service: AuthService = Depends(lambda: AuthService(get_supabase_client()))):
     """
     Register a new user.
     """
@@ -20,7 +20,7 @@ def register(user_data: UserCreate, auth_service: AuthService = Depends(lambda:
 
 
 @router.post("/login", response_model=Token)
-def login(user_data: UserLogin, auth_service: AuthService = Depends(lambda: AuthService(supabase_client))):
+def login(user_data: UserLogin, auth_service: AuthService = Depends(lambda: AuthService(get_supabase_client()))):
     """
     Login for existing users.
     """
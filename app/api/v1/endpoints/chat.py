@@ -1,13 +1,19 @@
-from typing import Optional, Tuple, List
+from typing import AsyncIterator, Optional, Tuple, List
+import logging
 import uuid
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel # Added BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field # Added BaseModel
+from starlette.background import BackgroundTask
+from app.core.config import settings
 from app.schemas.chat import ChatRequest, ChatResponse
-from app.services.rag_service import rag_service_instance, RAGService
-from app.services.chat_history_service import chat_history_service_instance, ChatHistoryService
-from app.utils.security import get_optional_current_user_context
+from app.services.rag_service import RAGService, get_rag_service
+from app.services.chat_history_service import ChatHistoryService, get_chat_history_service
+from app.utils.security import get_optional_current_user_context, has_role
 
-router = APIRouter()
+# Chat responses are serialized with orjson, which is several times faster than the stdlib encoder
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Define a new schema for chat messages in history
 class HistoryMessage(BaseModel):
@@ -22,8 +28,8 @@ class ChatHistoryResponse(BaseModel):
 @router.post("", response_model=ChatResponse)
 async def get_chat_answer(
     request: ChatRequest,
-    rag_service: RAGService = Depends(lambda: rag_service_instance),
-    history_service: ChatHistoryService = Depends(lambda: chat_history_service_instance),
+    rag_service: RAGService = Depends(get_rag_service),
+    history_service: ChatHistoryService = Depends(get_chat_history_service),
     user_context: Tuple[Optional[str], Optional[str]] = Depends(get_optional_current_user_context)
 ) -> ChatResponse:
     user_id, access_token = user_context
@@ -34,21 +40,23 @@ async def get_chat_answer(
     session_id = request.session_id or str(uuid.uuid4())
 
     # 2. Get the answer from the RAG service, providing the session and user context
-    response = rag_service.get_answer(
+    response = await rag_service.aget_answer(
         query=request.query, 
         session_id=session_id, 
-        user_id=user_id
+        user_id=user_id,
+        access_token=access_token,
+        debug=request.debug
     )
 
-    # 3. Save the user's query and the AI's answer to the history
-    history_service.add_message(
+    # 3. Queue the user's query and the AI's answer for write-behind persistence
+    await history_service.aenqueue_message(
         session_id=session_id, 
         role='user', 
         content=request.query, 
         user_id=user_id,
         access_token=access_token # Pass access_token
     )
-    history_service.add_message(
+    await history_service.aenqueue_message(
         session_id=session_id, 
         role='assistant', 
         content=response.answer, 
@@ -61,35 +69,128 @@ async def get_chat_answer(
     
     return response
 
+def _sse(event: str, data) -> str:
+    """Formats a single Server-Sent Event."""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+@router.post("/stream")
+async def stream_chat_answer(
+    request: ChatRequest,
+    rag_service: RAGService = Depends(get_rag_service),
+    history_service: ChatHistoryService = Depends(get_chat_history_service),
+    user_context: Tuple[Optional[str], Optional[str]] = Depends(get_optional_current_user_context)
+) -> StreamingResponse:
+    """
+    Streaming variant of the chat endpoint (Server-Sent Events).
+    Emits a `sources` event, then `token` events as the answer is generated,
+    and finally a `done` event carrying the session ID. History is saved once the stream completes.
+    """
+    user_id, access_token = user_context
+    session_id = request.session_id or str(uuid.uuid4())
+    events = rag_service.astream_answer(
+        query=request.query,
+        session_id=session_id,
+        user_id=user_id,
+        access_token=access_token
+    )
+    # Pull the first event (sources) before the response starts, so retrieval errors
+    # are still returned as regular HTTP errors instead of a broken stream.
+    first_event = await events.__anext__()
+    answer_tokens: List[str] = []
+    completed = False
+
+    async def event_stream() -> AsyncIterator[str]:
+        nonlocal completed
+        yield _sse(first_event["event"], first_event["data"])
+        try:
+            async for event in events:
+                answer_tokens.append(event["data"])
+                yield _sse(event["event"], event["data"])
+        except HTTPException as e:
+            # e.g. 429 when the LLM admission queue times out after the stream has started
+            logging.warning(f"Streaming answer stopped: {e.detail}")
+            yield _sse("error", {"detail": e.detail})
+            return
+        except Exception as e:
+            logging.error(f"Error while streaming answer: {e}")
+            yield _sse("error", {"detail": "Failed to generate an answer."})
+            return
+        completed = True
+        yield _sse("done", {"session_id": session_id})
+
+    async def persist_history():
+        if not completed:
+            return
+        await history_service.aenqueue_message(session_id=session_id, role='user', content=request.query, user_id=user_id, access_token=access_token)
+        await history_service.aenqueue_message(session_id=session_id, role='assistant', content="".join(answer_tokens), user_id=user_id, access_token=access_token)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(persist_history),
+    )
+
+class ChatBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=settings.CHAT_BATCH_MAX_QUERIES, description="Independent questions to answer.")
+
+@router.post("/batch")
+async def batch_chat_answers(
+    request: ChatBatchRequest,
+    rag_service: RAGService = Depends(get_rag_service),
+    current_user: dict = Depends(has_role(["admin"]))
+) -> StreamingResponse:
+    """
+    Answers many questions in one request, e.g. for evaluation runs or pre-warming the answer cache.
+    Each question is answered without chat history, and nothing is saved to history.
+    Results stream back as NDJSON, one line per question in completion order, with `index`
+    pointing into `queries`. A failed question gets an `error` line; the rest of the batch continues.
+    """
+    batch_id = f"batch-{uuid.uuid4()}"
+
+    async def result_lines() -> AsyncIterator[bytes]:
+        async for index, result in rag_service.abatch_answer(request.queries, session_id=batch_id, max_concurrency=settings.CHAT_BATCH_LLM_CONCURRENCY):
+            item = {"index": index, "query": request.queries[index]}
+            if isinstance(result, HTTPException):
+                item["error"] = result.detail
+            elif isinstance(result, Exception):
+                logging.error(f"Batch item {index} failed: {result}")
+                item["error"] = "Failed to generate an answer."
+            else:
+                item.update(result.model_dump(exclude={"debug_info", "session_id"}))
+            yield orjson.dumps(item) + b"\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
 @router.get("/history", response_model=ChatHistoryResponse) # Changed response_model
 async def get_chat_history(
     session_id: Optional[str] = None, # Allow session_id as query param for anonymous users
-    history_service: ChatHistoryService = Depends(lambda: chat_history_service_instance),
+    history_service: ChatHistoryService = Depends(get_chat_history_service),
     user_context: Tuple[Optional[str], Optional[str]] = Depends(get_optional_current_user_context)
 ) -> ChatHistoryResponse: # Changed response_model
     user_id, access_token = user_context
-    print(f"DEBUG: get_chat_history endpoint hit! session_id: {session_id}, user_id: {user_id}")
-    
+    logging.debug(f"Chat history requested for session_id: {session_id}, user_id: {user_id}")
+
     # Prioritize user_id for logged-in users, otherwise use session_id
     if user_id:
-        history_messages = history_service.get_history(session_id=session_id, user_id=user_id, access_token=access_token)
+        history_messages = await history_service.aget_history(session_id=session_id, user_id=user_id, access_token=access_token)
     elif session_id:
-        history_messages = history_service.get_history(session_id=session_id, user_id=None, access_token=access_token)
+        history_messages = await history_service.aget_history(session_id=session_id, user_id=None, access_token=access_token)
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Either session_id or a valid authentication token must be provided."
         )
-    print(f"DEBUG: Returning history_messages: {history_messages}")
+    logging.debug(f"Returning {len(history_messages)} history messages.")
     return ChatHistoryResponse(messages=history_messages, session_id=session_id or "N/A") # Changed return
 
 class ClearChatHistoryRequest(BaseModel):
     session_id: Optional[str] = None
 
 @router.post("/clear")
-def clear_chat_history(
+async def clear_chat_history(
     request: ClearChatHistoryRequest,
-    history_service: ChatHistoryService = Depends(lambda: chat_history_service_instance),
+    history_service: ChatHistoryService = Depends(get_chat_history_service),
     user_context: Tuple[Optional[str], Optional[str]] = Depends(get_optional_current_user_context)
 ):
     user_id, access_token = user_context
@@ -101,7 +202,7 @@ def clear_chat_history(
             detail="Either session_id or a valid authentication token must be provided to clear history."
         )
 
-    history_service.clear_history(
+    await history_service.aclear_history(
         user_id=user_id, 
         session_id=session_id, 
         access_token=access_token
@@ -1,21 +1,75 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends, UploadFile, File
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from python_multipart.multipart import MultipartParser, parse_options_header
+from typing import List, Optional, Tuple
 
-from app.services.rag_service import RAGService
+from app.core.config import settings
+from app.services.ingestion_jobs import IngestionJob, IngestionJobManager, ingestion_job_manager
+from app.services.rag_service import RAGService, get_rag_service
 from app.utils.security import has_role
 
 router = APIRouter()
 
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # Slack for boundaries and part headers in the Content-Length check
+
+# The upload body is parsed by hand (see `_save_upload`), so its schema is declared here for the docs.
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
 class IngestRequest(BaseModel):
     file_paths: Optional[List[str]] = Field(None, description="List of local file paths to ingest.")
     urls: Optional[List[str]] = Field(None, description="List of URLs to ingest.")
 
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    status: str
+    description: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    docs_loaded: int = 0
+    chunks_embedded: int = 0
+    chunks_uploaded: int = 0
+    chunks_skipped: int = 0
+    chunks_deleted: int = 0
+    chunks_per_second: float = 0.0
+
+    @classmethod
+    def from_job(cls, job: IngestionJob) -> "IngestionJobResponse":
+        return cls(
+            job_id=job.id,
+            status=job.status.value,
+            description=job.description,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            error=job.error,
+            docs_loaded=job.stats.docs_loaded,
+            chunks_embedded=job.stats.chunks_embedded,
+            chunks_uploaded=job.stats.chunks_uploaded,
+            chunks_skipped=job.stats.chunks_skipped,
+            chunks_deleted=job.stats.chunks_deleted,
+            chunks_per_second=job.stats.chunks_per_second if job.started_at else 0.0,
+        )
+
 @router.post("/ingest", status_code=status.HTTP_202_ACCEPTED)
-async def ingest_data(request: IngestRequest, background_tasks: BackgroundTasks, rag_service: RAGService = Depends(RAGService), current_user: dict = Depends(has_role(["admin"]))):
+async def ingest_data(request: IngestRequest, rag_service: RAGService = Depends(get_rag_service), job_manager: IngestionJobManager = Depends(lambda: ingestion_job_manager), current_user: dict = Depends(has_role(["admin"]))):
     """
     Endpoint to ingest data from files and URLs into the vector store.
-    This process runs in the background.
+    The ingestion runs as a background job; poll `/data/jobs/{job_id}` for progress.
     """
     if not request.file_paths and not request.urls:
         raise HTTPException(
@@ -23,30 +77,152 @@ async def ingest_data(request: IngestRequest, background_tasks: BackgroundTasks,
             detail="Either 'file_paths' or 'urls' must be provided."
         )
 
-    # Run the ingestion in the background to avoid blocking the API
-    background_tasks.add_task(rag_service.ingest_data, file_paths=request.file_paths, urls=request.urls)
+    job = job_manager.submit(
+        lambda stats, cancel_event: rag_service.ingest_data(file_paths=request.file_paths, urls=request.urls, stats=stats, cancel_event=cancel_event),
+        description=f"{len(request.file_paths or [])} file(s), {len(request.urls or [])} URL(s)",
+    )
 
-    return {"message": "Data ingestion started in the background."}
+    return {"message": "Data ingestion started in the background.", "job_id": job.id}
 
-@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
-async def upload_file(file: UploadFile = File(...), background_tasks: BackgroundTasks = BackgroundTasks(), rag_service: RAGService = Depends(RAGService), current_user: dict = Depends(has_role(["admin"]))):
+@router.post("/purge-untracked", status_code=status.HTTP_202_ACCEPTED)
+async def purge_untracked_chunks(rag_service: RAGService = Depends(get_rag_service), job_manager: IngestionJobManager = Depends(lambda: ingestion_job_manager), current_user: dict = Depends(has_role(["admin"]))):
+    """
+    Deletes chunks the ingest manifest doesn't track, such as copies left by ingests from before
+    incremental re-ingestion. Re-ingest every source first. Runs as a background job that waits
+    for running ingests; poll `/data/jobs/{job_id}` for progress.
+    """
+    job = job_manager.submit(
+        lambda stats, cancel_event: rag_service.purge_untracked_chunks(stats=stats, cancel_event=cancel_event),
+        description="purge untracked chunks",
+    )
+
+    return {"message": "Purge of untracked chunks started in the background.", "job_id": job.id}
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED, openapi_extra=UPLOAD_OPENAPI)
+async def upload_file(request: Request, rag_service: RAGService = Depends(get_rag_service), job_manager: IngestionJobManager = Depends(lambda: ingestion_job_manager), current_user: dict = Depends(has_role(["admin"]))):
     """
     Endpoint to upload a single file for ingestion into the vector store.
-    This process runs in the background.
+    The ingestion runs as a background job; poll `/data/jobs/{job_id}` for progress.
     """
-    if not file.filename.lower().endswith(".pdf"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only PDF files are supported for upload."
-        )
+    # Stream the upload straight from the socket to a uniquely named temp file, after the admin
+    # check has passed, so memory stays flat, oversized files are cut off while they arrive,
+    # and concurrent uploads of the same filename don't overwrite each other.
+    file_location, filename = await _save_upload(request)
 
-    # Save the uploaded file temporarily
-    file_location = f"/tmp/{file.filename}"
-    with open(file_location, "wb") as buffer:
-        buffer.write(await file.read())
+    # The original filename is recorded as the source; the temp file is removed when the job ends
+    job = job_manager.submit(
+        lambda stats, cancel_event: rag_service.ingest_data(file_paths=[file_location], source_names={file_location: filename}, stats=stats, cancel_event=cancel_event),
+        description=f"upload '{filename}'",
+        cleanup=lambda: os.remove(file_location),
+    )
 
-    # Run the ingestion in the background
-    background_tasks.add_task(rag_service.ingest_data, file_paths=[file_location])
+    return {"message": f"File '{filename}' uploaded and ingestion started in the background.", "job_id": job.id}
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_ingestion_job(job_id: str, job_manager: IngestionJobManager = Depends(lambda: ingestion_job_manager), current_user: dict = Depends(has_role(["admin"]))):
+    """
+    Reports the status and progress of an ingestion job.
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingestion job not found.")
+    return IngestionJobResponse.from_job(job)
 
-    return {"message": f"File '{file.filename}' uploaded and ingestion started in the background."}
+@router.delete("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def cancel_ingestion_job(job_id: str, job_manager: IngestionJobManager = Depends(lambda: ingestion_job_manager), current_user: dict = Depends(has_role(["admin"]))):
+    """
+    Cancels an ingestion job. A running job stops before its next batch.
+    """
+    job = job_manager.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingestion job not found.")
+    return IngestionJobResponse.from_job(job)
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File exceeds the {settings.MAX_UPLOAD_BYTES / 1024 / 1024:.1f} MB upload limit."
+    )
+
+class _UploadReceiver:
+    """Callbacks for python-multipart's streaming parser that collect the data of the `file` part."""
+
+    def __init__(self):
+        self.filename: Optional[str] = None
+        self.pending: List[bytes] = []
+        self.done = False
+        self._in_file = False
+        self._headers: dict = {}
+        self._field = b""
+        self._value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._headers.clear,
+            "on_header_field": lambda data, start, end: self._append("_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append("_value", data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _append(self, attr: str, data: bytes):
+        setattr(self, attr, getattr(self, attr) + data)
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._in_file = options.get(b"name") == b"file" and self.filename is None
+        if self._in_file:
+            self.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.pending.append(data[start:end])
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self.done = True
+
+async def _save_upload(request: Request) -> Tuple[str, str]:
+    """
+    Streams the `file` part of a multipart upload into a temp file, enforcing MAX_UPLOAD_BYTES
+    as the body arrives (and up front from Content-Length). Returns (file_location, filename).
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+        raise _too_large()
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data upload with a 'file' field.")
 
+    receiver = _UploadReceiver()
+    parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+    fd, file_location = tempfile.mkstemp(prefix="upload-", suffix=".pdf", dir=settings.UPLOAD_DIR)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if receiver.filename is not None and not receiver.filename.lower().endswith(".pdf"):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only PDF files are supported for upload.")
+                data = b"".join(receiver.pending)
+                receiver.pending.clear()
+                size += len(data)
+                if size > settings.MAX_UPLOAD_BYTES:
+                    raise _too_large()
+                if data:
+                    await asyncio.to_thread(buffer.write, data)
+                if receiver.done:
+                    break  # Anything after the file part is ignored
+        if not receiver.done:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The upload has no complete 'file' field.")
+    except BaseException:
+        os.remove(file_location)
+        raise
+    return file_location, receiver.filename
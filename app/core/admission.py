@@ -0,0 +1,276 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Deque, List, Optional
+
+from fastapi import HTTPException, status
+from langchain_core.embeddings import Embeddings
+
+from app.core.metrics import admission_decisions, admission_wait
+from app.utils.tokens import CHARS_PER_TOKEN
+
+# Who the current request's model calls are made for; set once per chat request.
+_client_key: ContextVar[str] = ContextVar("admission_client_key", default="anonymous")
+
+
+def client_key(user_id: Optional[str], session_id: Optional[str]) -> str:
+    """Fair-queuing key: the authenticated user, otherwise the anonymous session."""
+    return f"user:{user_id}" if user_id else f"session:{session_id}"
+
+
+def set_client_key(key: str):
+    """Attributes model calls made from the current context (and tasks it starts) to `key`."""
+    _client_key.set(key)
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Cheap length-based token estimate; admission only needs the order of magnitude, not a tokenizer pass."""
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + 1
+
+
+class _Waiter:
+    __slots__ = ("key", "tokens", "future")
+
+    def __init__(self, key: str, tokens: int, future: asyncio.Future):
+        self.key = key
+        self.tokens = tokens
+        self.future = future
+
+
+class AdmissionController:
+    """
+    Bounds concurrent calls to a rate-limited model deployment.
+
+    A call is admitted while fewer than `max_concurrency` calls are running and the estimated
+    tokens of the running calls stay within `max_tokens` (a call larger than the whole budget
+    runs alone). Otherwise it waits in a bounded queue, served round-robin across client keys
+    and FIFO within a key, so one busy user or session can't starve the others.
+    A full queue is rejected immediately, and a waiter not admitted within `queue_timeout`
+    gives up; both raise 429 with a Retry-After estimate instead of piling onto the quota.
+
+    Background calls (`admit(..., background=True)`, or `admit_background` from worker threads,
+    e.g. ingestion) share the same budget at lower priority: they are admitted only while no interactive call is waiting, hold
+    at most `max_background_concurrency` slots, and wait without a deadline instead of failing.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_tokens: int, max_queue: int, max_queue_per_key: int, queue_timeout: float,
+                 max_background_concurrency: Optional[int] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_tokens = max_tokens
+        self.max_queue = max_queue
+        self.max_queue_per_key = max_queue_per_key
+        self.queue_timeout = queue_timeout
+        self.max_background_concurrency = max_background_concurrency or max(1, max_concurrency // 2)
+        self._running = 0
+        self._running_tokens = 0
+        self._running_background = 0
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._queued = 0  # Interactive waiters only; background waiters never count against the queue limits
+        self._background: Deque[_Waiter] = deque()
+        self._hold_seconds = 1.0  # Moving average of how long an interactive call holds its slot, for Retry-After
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # The loop the controller's futures live on
+
+    def _fits(self, tokens: int) -> bool:
+        return self._running < self.max_concurrency and (self._running == 0 or self._running_tokens + tokens <= self.max_tokens)
+
+    def _fits_background(self, tokens: int) -> bool:
+        return self._running_background < self.max_background_concurrency and self._fits(tokens)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained enough to admit one more call."""
+        return max(1, math.ceil(self._hold_seconds * (self._queued + 1) / self.max_concurrency))
+
+    def _reject(self, detail: str, outcome: str):
+        admission_decisions.inc(resource=self.name, outcome=outcome)
+        retry_after = self.retry_after()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"{detail} Please try again in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def check(self, key: str, max_queue_per_key: Optional[int] = None):
+        """Raises 429 right away if a call for `key` could not even be queued, before any work is spent on it."""
+        if self._queued >= self.max_queue:
+            self._reject("The assistant is busy.", "rejected_full")
+        per_key = self.max_queue_per_key if max_queue_per_key is None else max_queue_per_key
+        if len(self._queues.get(key, ())) >= per_key:
+            self._reject("Too many questions in progress.", "rejected_full")
+
+    async def acquire(self, key: str, tokens: int, max_queue_per_key: Optional[int] = None):
+        self._loop = asyncio.get_running_loop()
+        if not self._queued and self._fits(tokens):
+            self._grant(tokens)
+            admission_decisions.inc(resource=self.name, outcome="admitted")
+            return
+        self.check(key, max_queue_per_key)
+
+        waiter = _Waiter(key, tokens, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(key, deque()).append(waiter)
+        self._queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._remove(waiter):
+                self._reject("The assistant is busy.", "rejected_deadline")
+            # Admitted just as the deadline passed: keep the slot.
+        except asyncio.CancelledError:
+            if not self._remove(waiter):
+                self.release(tokens)  # Admitted, but the caller is gone
+            raise
+        finally:
+            admission_wait.observe(time.perf_counter() - start, resource=self.name)
+        admission_decisions.inc(resource=self.name, outcome="queued")
+
+    async def _acquire_background(self, tokens: int):
+        self._loop = asyncio.get_running_loop()
+        if not self._queued and not self._background and self._fits_background(tokens):
+            self._grant(tokens, background=True)
+            admission_decisions.inc(resource=self.name, outcome="admitted")
+            return
+        waiter = _Waiter("background", tokens, self._loop.create_future())
+        self._background.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.shield(waiter.future)
+        except asyncio.CancelledError:
+            if waiter in self._background:
+                self._background.remove(waiter)
+            else:
+                self.release(tokens, background=True)  # Admitted, but the caller is gone
+            raise
+        finally:
+            admission_wait.observe(time.perf_counter() - start, resource=self.name)
+        admission_decisions.inc(resource=self.name, outcome="queued")
+
+    def release(self, tokens: int, held_seconds: Optional[float] = None, background: bool = False):
+        self._running -= 1
+        self._running_tokens -= tokens
+        if background:
+            self._running_background -= 1
+        elif held_seconds is not None:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, key: str, tokens: int, max_queue_per_key: Optional[int] = None, background: bool = False):
+        """Holds an admission slot for the enclosed call; a `background` slot ignores `key` and has lower priority."""
+        if background:
+            await self._acquire_background(tokens)
+        else:
+            await self.acquire(key, tokens, max_queue_per_key)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(tokens, time.perf_counter() - start, background)
+
+    @contextmanager
+    def admit_background(self, tokens: int):
+        """
+        Holds a background slot for a blocking call made from a worker thread. The slot is taken on
+        the event loop the controller serves, so the call counts against the same quota as requests;
+        with no running loop to share with (or when called on that loop), the call runs unadmitted.
+        """
+        loop = self._loop
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if loop is None or loop.is_closed() or not loop.is_running() or on_loop:
+            yield
+            return
+        asyncio.run_coroutine_threadsafe(self._acquire_background(tokens), loop).result()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            loop.call_soon_threadsafe(self.release, tokens, time.perf_counter() - start, True)
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Records the serving event loop up front, so background calls are admitted before the first request."""
+        self._loop = loop
+
+    def _grant(self, tokens: int, background: bool = False):
+        self._running += 1
+        self._running_tokens += tokens
+        if background:
+            self._running_background += 1
+
+    def _dispatch(self):
+        """
+        Admits waiters in round-robin key order for as long as the head of the line fits, then
+        background waiters once no interactive call is left waiting.
+        """
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            if not self._fits(waiter.tokens):
+                break
+            queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._grant(waiter.tokens)
+            waiter.future.set_result(None)
+        while not self._queues and self._background and self._fits_background(self._background[0].tokens):
+            waiter = self._background.popleft()
+            self._grant(waiter.tokens, background=True)
+            waiter.future.set_result(None)
+
+    def _remove(self, waiter: _Waiter) -> bool:
+        """Takes a waiter out of the queue; False if it was already admitted."""
+        queue = self._queues.get(waiter.key)
+        if queue is None or waiter not in queue:
+            return False
+        queue.remove(waiter)
+        self._queued -= 1
+        if not queue:
+            del self._queues[waiter.key]
+        self._dispatch()  # A large waiter at the head may have been holding the others back
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "running_tokens": self._running_tokens,
+            "queued": self._queued,
+            "queued_keys": len(self._queues),
+            "background_running": self._running_background,
+            "background_queued": len(self._background),
+            "retry_after": self.retry_after(),
+        }
+
+
+class AdmittedEmbeddings(Embeddings):
+    """
+    Runs embeddings through an AdmissionController. Async calls (query embeddings and the batched
+    query embeddings of batch answering) queue under the current request's client; blocking document
+    embeddings (ingestion, from worker threads) take background slots, so they can't crowd out chats.
+    """
+
+    def __init__(self, embedder: Embeddings, admission: AdmissionController):
+        self.embedder = embedder
+        self.admission = admission
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embedder.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.admission.admit_background(estimate_tokens(*texts)):
+            return self.embedder.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        async with self.admission.admit(_client_key.get(), estimate_tokens(text)):
+            return await self.embedder.aembed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        async with self.admission.admit(_client_key.get(), estimate_tokens(*texts)):
+            return await self.embedder.aembed_documents(texts)
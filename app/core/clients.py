@@ -4,43 +4,55 @@ from supabase import create_client, Client as SupabaseClient
 from openai import AzureOpenAI
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 
+from app.core.admission import AdmissionController, AdmittedEmbeddings
 from app.core.config import settings
+from app.core.embedding_cache import CachedEmbeddings
+from app.core.supabase_rest import SupabaseRestClient
+from app.utils.lazy import lazy
+
+# Every client is built on first use (or by the warm-up in app.main), not at import time.
 
 # --- Supabase Client ---
+@lazy
 def get_supabase_client() -> SupabaseClient:
-    """Initializes and returns a Supabase client instance."""
+    """Returns the shared Supabase client instance."""
     return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
-supabase_client: SupabaseClient = get_supabase_client()
+# Shared keep-alive client for table reads/writes; callers pass their access token per request.
+@lazy
+def get_supabase_rest_client() -> SupabaseRestClient:
+    """Returns the pooled PostgREST client used for table access."""
+    return SupabaseRestClient(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
 
 
 # --- Azure OpenAI Client (for general purpose use) ---
+@lazy
 def get_azure_openai_client() -> AzureOpenAI:
-    """Initializes and returns a general Azure OpenAI client."""
+    """Returns the shared general Azure OpenAI client."""
     return AzureOpenAI(
         api_key=settings.AZURE_OPENAI_API_KEY,
         api_version=settings.AZURE_OPENAI_API_VERSION,
         azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
     )
 
-azure_openai_client: AzureOpenAI = get_azure_openai_client()
-
 
 # --- Langchain Specific Clients ---
+@lazy
 def get_azure_llm() -> AzureChatOpenAI:
-    """Initializes and returns a Langchain Azure Chat Model instance."""
+    """Returns the shared Langchain Azure Chat Model instance."""
     return AzureChatOpenAI(
         openai_api_version=settings.AZURE_OPENAI_API_VERSION,
         azure_deployment=settings.AZURE_OPENAI_CHAT_DEPLOYMENT_NAME,
         azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
         api_key=settings.AZURE_OPENAI_API_KEY,
         temperature=0,
-        max_tokens=1024,
+        max_tokens=settings.LLM_MAX_COMPLETION_TOKENS,
     )
 
+@lazy
 def get_azure_embedder() -> AzureOpenAIEmbeddings:
-    """Initializes and returns a Langchain Azure Embeddings Model instance."""
+    """Returns the shared Langchain Azure Embeddings Model instance."""
     return AzureOpenAIEmbeddings(
         azure_deployment=settings.AZURE_OPENAI_DEPLOYMENT_NAME,
         openai_api_version=settings.AZURE_OPENAI_API_VERSION,
@@ -48,6 +60,38 @@ def get_azure_embedder() -> AzureOpenAIEmbeddings:
         api_key=settings.AZURE_OPENAI_API_KEY,
     )
 
-# Instantiate Langchain clients for use in services
-azure_llm = get_azure_llm()
-azure_embedder = get_azure_embedder()
+@lazy
+def get_cached_azure_embedder() -> CachedEmbeddings:
+    """
+    Returns the Azure embedder wrapped with an LRU + TTL cache for query embeddings.
+    Cache misses go through the embedding admission controller.
+    """
+    return CachedEmbeddings(
+        AdmittedEmbeddings(get_azure_embedder(), get_embedding_admission()),
+        namespace=settings.AZURE_OPENAI_DEPLOYMENT_NAME,
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+    )
+
+
+# --- Admission control (per worker) ---
+def _admission_controller(name: str, max_concurrency: int, max_tokens: int) -> AdmissionController:
+    return AdmissionController(
+        name,
+        max_concurrency=max_concurrency,
+        max_tokens=max_tokens,
+        max_queue=settings.ADMISSION_QUEUE_MAX,
+        max_queue_per_key=settings.ADMISSION_QUEUE_MAX_PER_CLIENT,
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        max_background_concurrency=max(1, int(max_concurrency * settings.ADMISSION_BACKGROUND_SHARE)),
+    )
+
+@lazy
+def get_llm_admission() -> AdmissionController:
+    """Returns the admission controller for chat model calls."""
+    return _admission_controller("llm", settings.LLM_MAX_CONCURRENCY, settings.LLM_MAX_INFLIGHT_TOKENS)
+
+@lazy
+def get_embedding_admission() -> AdmissionController:
+    """Returns the admission controller for embedding calls (queries first, ingestion in the background)."""
+    return _admission_controller("embedding", settings.EMBEDDING_MAX_CONCURRENCY, settings.EMBEDDING_MAX_INFLIGHT_TOKENS)
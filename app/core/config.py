@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -16,13 +17,109 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     SUPABASE_JWT_SECRET: str
 
-    # Azure AI Search
-    AZURE_AI_SEARCH_ENDPOINT: str
-    AZURE_AI_SEARCH_KEY: str
-    AZURE_AI_SEARCH_INDEX_NAME: str
+    # Auth: access tokens are verified locally; set AUTH_REMOTE_VERIFY to also check revocation with Supabase
+    AUTH_REMOTE_VERIFY: bool = False
+    AUTH_CLAIMS_CACHE_MAX_ENTRIES: int = 10000
+
+    # Vector store: "azure" (Azure AI Search) or "local" (memory-mapped index on disk, no network)
+    VECTOR_STORE_BACKEND: str = "azure"
+    LOCAL_VECTOR_STORE_PATH: str = "data/vector_store"
+    LOCAL_VECTOR_STORE_COMPACT_DEAD_FRACTION: float = 0.3  # Rewrite the local index once this share of its rows are deleted
+    RETRIEVER_K: int = 8
+    # Hybrid retrieval: BM25 over ingested chunks fused with vector search (reciprocal rank fusion)
+    HYBRID_RETRIEVAL_ENABLED: bool = True
+    LEXICAL_INDEX_PATH: str = "data/lexical_index.json"
+    LEXICAL_INDEX_RELOAD_SECONDS: float = 5.0  # How often workers check for an index saved by another worker
+    RRF_K: int = 60
+    # Context packing: retrieved chunks are merged, diversified (MMR) and trimmed to this many prompt tokens
+    CONTEXT_TOKEN_BUDGET: int = 1500
+    CONTEXT_MMR_LAMBDA: float = 0.7
+    TOKENIZER_ENCODING: str = "cl100k_base"
+    # Answer greetings / thanks / obvious off-topic queries from templates, skipping retrieval and the LLM
+    INTENT_ROUTER_ENABLED: bool = True
+    # Batch chat endpoint: queries per request and concurrent LLM calls per batch
+    CHAT_BATCH_MAX_QUERIES: int = 500
+    CHAT_BATCH_LLM_CONCURRENCY: int = 8
+    # Each source in a chat response carries at most this many characters of its text
+    SOURCE_SNIPPET_CHARS: int = 200
+
+    # Azure AI Search (only required when VECTOR_STORE_BACKEND is "azure")
+    AZURE_AI_SEARCH_ENDPOINT: Optional[str] = None
+    AZURE_AI_SEARCH_KEY: Optional[str] = None
+    AZURE_AI_SEARCH_INDEX_NAME: Optional[str] = None
 
     # App
     USER_AGENT: str
 
+    # Ingestion: embedding batches, concurrency and 429 backoff against Azure OpenAI
+    INGEST_EMBED_BATCH_SIZE: int = 64
+    INGEST_MAX_CONCURRENT_BATCHES: int = 4
+    INGEST_UPLOAD_BATCH_SIZE: int = 500
+    INGEST_MAX_RETRIES: int = 6
+    INGEST_BACKOFF_BASE_SECONDS: float = 1.0
+    INGEST_BACKOFF_MAX_SECONDS: float = 60.0
+    # Source -> chunk ID manifest used to skip unchanged chunks on re-ingestion
+    INGEST_MANIFEST_PATH: str = "data/ingest_manifest.json"
+    # Ingestion job workers (separate from the request-serving threads)
+    INGEST_MAX_JOBS: int = 2
+    INGEST_JOBS_RETAINED: int = 200
+    # Uploads are streamed to this directory (system temp dir if unset)
+    UPLOAD_DIR: Optional[str] = None
+    MAX_UPLOAD_BYTES: int = 50 * 1024 * 1024
+
+    # Per-stage timeouts on the chat path
+    RETRIEVAL_TIMEOUT_SECONDS: float = 10.0
+    HISTORY_TIMEOUT_SECONDS: float = 3.0
+
+    # Query embedding cache
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 2048
+    EMBEDDING_CACHE_TTL_SECONDS: int = 3600
+
+    # Semantic answer cache (history-free questions only)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+
+    # Concurrent identical questions share one retrieval, and one LLM call when they have no chat history
+    COALESCE_IDENTICAL_QUERIES: bool = True
+
+    # Write-behind persistence of chat messages
+    HISTORY_WRITE_BATCH_SIZE: int = 100
+    HISTORY_WRITE_FLUSH_INTERVAL_SECONDS: float = 1.0
+    HISTORY_WRITE_MAX_PENDING: int = 5000
+    HISTORY_WRITE_MAX_RETRIES: int = 3
+
+    # In-process cache of recent chat turns. Other workers' writes and clears are only seen once an entry
+    # expires, so keep the TTL short unless each session is routed to one worker (sticky sessions).
+    HISTORY_CACHE_MAX_SESSIONS: int = 10000
+    HISTORY_CACHE_TURNS: int = 20
+    HISTORY_CACHE_TTL_SECONDS: float = 5.0
+
+    # Prompt history: newest messages verbatim within a token budget, older ones folded into a rolling summary
+    HISTORY_FETCH_MESSAGES: int = 20
+    HISTORY_TOKEN_BUDGET: int = 600
+    HISTORY_MESSAGE_MAX_TOKENS: int = 150
+    HISTORY_SUMMARY_ENABLED: bool = True
+    HISTORY_SUMMARY_MAX_TOKENS: int = 200
+
+    # Admission control for model calls: concurrency and token budget in flight, then a fair, bounded wait queue
+    LLM_MAX_COMPLETION_TOKENS: int = 1024
+    LLM_MAX_CONCURRENCY: int = 32
+    LLM_MAX_INFLIGHT_TOKENS: int = 100000  # Estimated prompt + max completion tokens of running calls
+    EMBEDDING_MAX_CONCURRENCY: int = 64
+    EMBEDDING_MAX_INFLIGHT_TOKENS: int = 200000
+    ADMISSION_QUEUE_MAX: int = 256
+    ADMISSION_QUEUE_MAX_PER_CLIENT: int = 4  # Per user, or per session for anonymous users
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 15.0
+    ADMISSION_BACKGROUND_SHARE: float = 0.5  # Fraction of a deployment's concurrency that ingestion may hold
+
+    # Startup warm-up (builds clients, opens connections); bound on each step
+    WARMUP_TIMEOUT_SECONDS: float = 30.0
+    WARMUP_RETRY_MAX_SECONDS: float = 60.0  # Backoff cap when retrying failed readiness checks
+
+    # Prometheus metrics at /metrics (per-stage latency histograms, LLM token counts)
+    METRICS_ENABLED: bool = True
+
 # Instantiate settings
 settings = Settings()
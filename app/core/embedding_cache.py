@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.metrics import stage
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bounded LRU + TTL cache for query embeddings, wrapping another Embeddings model.
+
+    Entries are keyed on the deployment name plus the normalized query text, so repeated
+    questions skip the round trip to the embedding deployment. Document embeddings
+    (used during ingestion) are passed straight through and never cached.
+    Safe to share between threads and coroutines: the lock is only held for dictionary access.
+    Concurrent async misses for the same query share a single remote call.
+    """
+
+    def __init__(self, embedder: Embeddings, namespace: str, max_entries: int = 2048, ttl_seconds: float = 3600):
+        self.embedder = embedder
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Case-folds the text and collapses whitespace."""
+        return " ".join(text.casefold().split())
+
+    def _key(self, text: str) -> Tuple[str, str]:
+        return (self.namespace, self.normalize(text))
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Returns the cached embedding for `text`, or None (counted as a miss)."""
+        key = self._key(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, embedding = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, text: str, embedding: List[float]):
+        """Stores an embedding, evicting the least recently used entries beyond `max_entries`."""
+        key = self._key(text)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = self.get(text)
+        if embedding is None:
+            embedding = self.embedder.embed_query(text)
+            self.put(text, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        embedding = self.get(text)
+        if embedding is not None:
+            return embedding
+
+        key = self._key(text)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The caller that owned the request was cancelled; embed on our own.
+                return await self.embedder.aembed_query(text)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            with stage("embedding"):
+                embedding = await self.embedder.aembed_query(text)
+            self.put(text, embedding)
+            future.set_result(embedding)
+            return embedding
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it.
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many queries, fetching all cache misses in one batched call and caching them,
+        so later `aembed_query` calls for the same texts (e.g. from the retriever) are hits.
+        """
+        embeddings = [self.get(text) for text in texts]
+        misses = list(dict.fromkeys(self.normalize(text) for text, embedding in zip(texts, embeddings) if embedding is None))
+        if misses:
+            with stage("embedding"):
+                fetched = dict(zip(misses, await self.embedder.aembed_documents(misses)))
+            for text in misses:
+                self.put(text, fetched[text])
+            embeddings = [embedding if embedding is not None else fetched[self.normalize(text)] for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embedder.aembed_documents(texts)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,97 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Union
+
+import httpx
+
+
+class SupabaseRestClient:
+    """
+    Thin PostgREST client for Supabase tables that reuses keep-alive connections.
+
+    One long-lived sync and one async `httpx` client are shared by every caller.
+    The caller's access token is sent as a per-request `Authorization` header
+    (falling back to the anon key), so no client is rebuilt per request and
+    Row Level Security still sees the right user.
+
+    Filters use PostgREST syntax, e.g. `{"user_id": "eq.<uuid>", "created_at": "gte.<iso>"}`.
+    HTTP errors are raised as `httpx.HTTPStatusError`.
+    """
+
+    def __init__(self, supabase_url: str, api_key: str, timeout: float = 10.0, max_connections: int = 100):
+        self.rest_url = f"{supabase_url.rstrip('/')}/rest/v1"
+        self.api_key = api_key
+        self._timeout = timeout
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.Client(base_url=self.rest_url, headers={"apikey": api_key}, timeout=timeout, limits=self._limits)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # Async connections belong to the loop that opened them; scripts that call
+        # asyncio.run() repeatedly get a fresh pool per loop.
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(base_url=self.rest_url, headers={"apikey": self.api_key}, timeout=self._timeout, limits=self._limits)
+            self._async_loop = loop
+        return self._async_client
+
+    def _headers(self, access_token: Optional[str], prefer: Optional[str] = None) -> Dict[str, str]:
+        headers = {"Authorization": f"Bearer {access_token or self.api_key}"}
+        if prefer:
+            headers["Prefer"] = prefer
+        return headers
+
+    @staticmethod
+    def _select_params(columns: str, filters: Dict[str, str], order: Optional[str], limit: Optional[int]) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"select": columns, **filters}
+        if order:
+            params["order"] = order
+        if limit is not None:
+            params["limit"] = limit
+        return params
+
+    def insert(self, table: str, rows: Union[Dict[str, Any], List[Dict[str, Any]]], access_token: Optional[str] = None):
+        """Inserts one row or a list of rows in a single request."""
+        response = self._client.post(f"/{table}", json=rows, headers=self._headers(access_token, "return=minimal"))
+        response.raise_for_status()
+
+    def select(self, table: str, columns: str = "*", filters: Optional[Dict[str, str]] = None, order: Optional[str] = None, limit: Optional[int] = None, access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        response = self._client.get(f"/{table}", params=self._select_params(columns, filters or {}, order, limit), headers=self._headers(access_token))
+        response.raise_for_status()
+        return response.json()
+
+    def delete(self, table: str, filters: Dict[str, str], access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Deletes matching rows and returns them."""
+        response = self._client.delete(f"/{table}", params=filters, headers=self._headers(access_token, "return=representation"))
+        response.raise_for_status()
+        return response.json()
+
+    async def ainsert(self, table: str, rows: Union[Dict[str, Any], List[Dict[str, Any]]], access_token: Optional[str] = None):
+        response = await self._get_async_client().post(f"/{table}", json=rows, headers=self._headers(access_token, "return=minimal"))
+        response.raise_for_status()
+
+    async def aselect(self, table: str, columns: str = "*", filters: Optional[Dict[str, str]] = None, order: Optional[str] = None, limit: Optional[int] = None, access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        response = await self._get_async_client().get(f"/{table}", params=self._select_params(columns, filters or {}, order, limit), headers=self._headers(access_token))
+        response.raise_for_status()
+        return response.json()
+
+    async def adelete(self, table: str, filters: Dict[str, str], access_token: Optional[str] = None) -> List[Dict[str, Any]]:
+        response = await self._get_async_client().delete(f"/{table}", params=filters, headers=self._headers(access_token, "return=representation"))
+        response.raise_for_status()
+        return response.json()
+
+    async def awarm_up(self, table: str):
+        """
+        Opens a pooled async connection (DNS, TCP and TLS) ahead of the first real request
+        with a HEAD that reads no rows. Any HTTP status counts; connection errors are raised.
+        """
+        await self._get_async_client().head(f"/{table}", params={"select": "*", "limit": 0}, headers=self._headers(None))
+
+    def close(self):
+        self._client.close()
+
+    async def aclose(self):
+        self._client.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
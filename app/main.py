@@ -1,14 +1,39 @@
+import asyncio
 import logging
 import sys
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from app.api.v1.api import api_router
+from app.core.clients import get_embedding_admission, get_supabase_rest_client
 from app.core.config import settings
+from app.core.metrics import ServerTimingMiddleware, registry
+from app.services.chat_history_service import get_chat_history_service
+from app.services.ingestion_jobs import ingestion_job_manager
+from app.services.warmup import READINESS_CHECKS, readiness, recover_readiness, warm_up
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(levelname)s:     %(message)s')
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_chat_history_service().start_flusher()
+    # Ingestion embeds from worker threads; its admission slots are taken on this loop.
+    get_embedding_admission().bind(asyncio.get_running_loop())
+    # Warm up in the background: `/` answers right away, `/ready` once the chat path can serve.
+    app.state.warmup = asyncio.create_task(warm_up())
+    recovery = asyncio.create_task(recover_readiness(app.state.warmup))
+    yield
+    app.state.warmup.cancel()
+    recovery.cancel()
+    # Flush buffered chat messages before the worker exits
+    await get_chat_history_service().stop_flusher()
+    await get_supabase_rest_client().aclose()
+    await asyncio.to_thread(ingestion_job_manager.shutdown)
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Chatbot AI Backend",
     version="1.0.0",
     description="Backend for a RAG-based AI Chatbot with FastAPI, Supabase, and Azure AI.",
@@ -27,6 +52,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so request latency and Server-Timing cover CORS handling too
+app.add_middleware(ServerTimingMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/", tags=["Health Check"])
@@ -35,3 +63,29 @@ def read_root():
     Root endpoint to check if the API is running.
     """
     return {"status": "ok", "user_agent": settings.USER_AGENT}
+
+@app.get("/ready", tags=["Health Check"])
+async def read_ready():
+    """
+    Readiness probe: 200 once warm-up has finished and the chat path can serve, 503 until then.
+    Use `/` for liveness; a worker that is still warming up is alive but not ready.
+    Readiness checks reflect the current state, so a backend that recovers after start-up brings the worker back.
+    """
+    warmup = getattr(app.state, "warmup", None)
+    if warmup is None or not warmup.done() or warmup.cancelled():
+        return ORJSONResponse({"status": "starting"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    checks = {**warmup.result(), **readiness()}
+    ready = all(checks[name] for name in READINESS_CHECKS)
+    return ORJSONResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks},
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """
+    Prometheus scrape endpoint: per-stage chat latency, request latency and LLM token usage.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
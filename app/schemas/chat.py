@@ -1,18 +1,19 @@
 from pydantic import BaseModel
 from typing import List, Optional
 
-from typing import Optional
-
 class ChatRequest(BaseModel):
     query: str
     session_id: Optional[str] = None
+    debug: bool = False  # Include retrieval details (debug_info) in the response
 
 class Source(BaseModel):
     source: str
-    content: str
+    page: Optional[str] = None
+    snippet: str
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[Source]
     session_id: str
     debug_info: Optional[dict] = None
+    cache_hit: bool = False
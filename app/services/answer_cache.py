@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.schemas.chat import Source
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Source]
+    size_bytes: int
+
+
+class SemanticAnswerCache:
+    """
+    Caches answers to history-free questions and serves them for near-duplicate queries.
+
+    A lookup embeds nothing itself: the caller passes the query embedding and the cache
+    returns the entry whose stored query embedding has the highest cosine similarity,
+    provided it is at least `similarity_threshold`. Entries are evicted LRU-first once
+    either `max_entries` or the `max_bytes` memory budget is exceeded.
+
+    `index_version` is bumped by `invalidate()` whenever new documents are ingested;
+    answers computed against an older version are rejected by `put()`.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_version = 0
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._embeddings: dict[int, np.ndarray] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._next_id = 0
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_embedding: Sequence[float]) -> Optional[CachedAnswer]:
+        """Returns the closest cached answer above the similarity threshold, or None."""
+        query = self._normalize(query_embedding)
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._embeddings.keys())
+                self._matrix = np.vstack([self._embeddings[i] for i in self._matrix_ids])
+            if self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]
+
+    def put(self, query_embedding: Sequence[float], answer: str, sources: List[Source], index_version: int):
+        """Stores an answer computed against `index_version`; stale versions are dropped."""
+        embedding = self._normalize(query_embedding)
+        size_bytes = (
+            embedding.nbytes
+            + len(answer.encode("utf-8"))
+            + sum(len(source.source) + len(source.snippet.encode("utf-8")) for source in sources)
+        )
+        if size_bytes > self.max_bytes:
+            return
+        with self._lock:
+            if index_version != self.index_version:
+                return
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = CachedAnswer(answer=answer, sources=sources, size_bytes=size_bytes)
+            self._embeddings[entry_id] = embedding
+            self._total_bytes += size_bytes
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                evicted_id, evicted = self._entries.popitem(last=False)
+                del self._embeddings[evicted_id]
+                self._total_bytes -= evicted.size_bytes
+            self._matrix = None
+
+    def invalidate(self):
+        """Drops every cached answer and bumps the index version."""
+        with self._lock:
+            self.index_version += 1
+            self._entries.clear()
+            self._embeddings.clear()
+            self._matrix = None
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "bytes": self._total_bytes,
+                "index_version": self.index_version,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -1,116 +1,329 @@
-
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
+import asyncio
+import contextlib
 import logging
+from collections import deque
 from datetime import datetime, timedelta, timezone
-from supabase import create_client, Client
+from fastapi import HTTPException, status
+from app.core.clients import get_supabase_rest_client
 from app.core.config import settings
+from app.core.metrics import stage
+from app.core.supabase_rest import SupabaseRestClient
+from app.services.history_cache import SessionHistoryCache
+from app.utils.lazy import lazy
+
+CHAT_MESSAGES_TABLE = "chat_messages"
 
 class ChatHistoryService:
-    def __init__(self):
-        # Initialize with anon key for general use, will be re-initialized with user token if provided
-        try:
-            self.supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-            logging.info("Successfully connected to Supabase with anon key.")
-        except Exception as e:
-            logging.error(f"Failed to connect to Supabase: {e}")
-            self.supabase = None
-
-    def _get_authenticated_supabase_client(self, access_token: Optional[str] = None) -> Client:
-        """Returns a Supabase client, authenticated with the provided access_token if available."""
-        # Always start with the anon key client
-        client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-        
-        if access_token:
-            logging.info("Attempting to authenticate Supabase client with access token.")
-            try:
-                # Set the access token for the client to make authenticated requests
-                client.postgrest.auth(access_token)
-                logging.info("Supabase client authenticated with access token.")
-            except Exception as e:
-                logging.error(f"Failed to set access token on Supabase client: {e}")
-        else:
-            logging.info("No access token provided. Using anonymous Supabase client.")
-        return client
+    def __init__(self, rest_client: Optional[SupabaseRestClient] = None):
+        # A single pooled client is shared by all calls; the user's access token is sent per request.
+        self.rest = rest_client or get_supabase_rest_client()
+
+        # Write-behind buffer of (access_token, row) waiting to be bulk-inserted by the flusher.
+        self.batch_size = settings.HISTORY_WRITE_BATCH_SIZE
+        self.flush_interval = settings.HISTORY_WRITE_FLUSH_INTERVAL_SECONDS
+        self.max_pending = settings.HISTORY_WRITE_MAX_PENDING
+        self.max_retries = settings.HISTORY_WRITE_MAX_RETRIES
+        self._pending: deque[Tuple[Optional[str], Dict]] = deque()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.dropped_messages = 0
+
+        # Recent turns per user/session, so follow-up questions don't re-read what this process just wrote.
+        self.cache = SessionHistoryCache(
+            max_sessions=settings.HISTORY_CACHE_MAX_SESSIONS,
+            turns_per_session=settings.HISTORY_CACHE_TURNS,
+            ttl_seconds=settings.HISTORY_CACHE_TTL_SECONDS,
+        )
+
+    @staticmethod
+    def _owner_filter(session_id: Optional[str], user_id: Optional[str]) -> Dict[str, str]:
+        """Prioritizes user_id for logged-in users, otherwise falls back to session_id."""
+        if user_id:
+            return {"user_id": f"eq.{user_id}"}
+        return {"session_id": f"eq.{session_id}"}
+
+    @staticmethod
+    def _history_cutoff() -> str:
+        """History only covers the last 24 hours."""
+        return (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+
+    @staticmethod
+    def _history_filters(session_id: str, user_id: Optional[str], since: str) -> Dict[str, str]:
+        return {**ChatHistoryService._owner_filter(session_id, user_id), "created_at": f"gte.{since}"}
+
+    @staticmethod
+    def _to_messages(rows: List[Dict]) -> List[Dict[str, str]]:
+        # Rows come newest first; return them chronologically with only role and content
+        ordered_messages = sorted(rows, key=lambda x: x['created_at'])
+        return [{"role": msg['role'], "content": msg['content']} for msg in ordered_messages]
 
     def add_message(self, session_id: str, role: str, content: str, user_id: Optional[str] = None, access_token: Optional[str] = None):
         """Adds a new message to the chat history in Supabase."""
-        supabase_client = self._get_authenticated_supabase_client(access_token)
-        if not supabase_client:
-            logging.error("Supabase client not available. Cannot add message.")
-            return
+        try:
+            message_data = {
+                "session_id": session_id,
+                "role": role,
+                "content": content,
+                "user_id": user_id,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            self.rest.insert(CHAT_MESSAGES_TABLE, message_data, access_token=access_token)
+            self.cache.append(self.cache.key(session_id, user_id), role, content, message_data["created_at"])
+            logging.info(f"Message added to Supabase. User ID: {user_id}, Session ID: {session_id}")
+        except Exception as e:
+            logging.error(f"Error adding message to Supabase: {e}")
 
+    async def aadd_message(self, session_id: str, role: str, content: str, user_id: Optional[str] = None, access_token: Optional[str] = None):
+        """Async variant of `add_message`."""
         try:
             message_data = {
                 "session_id": session_id,
                 "role": role,
                 "content": content,
-                "user_id": user_id
+                "user_id": user_id,
+                "created_at": datetime.now(timezone.utc).isoformat(),
             }
-            supabase_client.table("chat_messages").insert(message_data).execute()
+            await self.rest.ainsert(CHAT_MESSAGES_TABLE, message_data, access_token=access_token)
+            self.cache.append(self.cache.key(session_id, user_id), role, content, message_data["created_at"])
             logging.info(f"Message added to Supabase. User ID: {user_id}, Session ID: {session_id}")
         except Exception as e:
             logging.error(f"Error adding message to Supabase: {e}")
 
+    async def aenqueue_message(self, session_id: str, role: str, content: str, user_id: Optional[str] = None, access_token: Optional[str] = None):
+        """
+        Buffers a message for the background flusher and returns immediately.
+        Falls back to a direct insert when the flusher is not running (e.g. in scripts).
+        When the buffer is full, the caller waits for a flush instead of growing memory.
+        """
+        with stage("history_insert"):
+            await self._aenqueue(session_id, role, content, user_id, access_token)
+
+    async def _aenqueue(self, session_id: str, role: str, content: str, user_id: Optional[str], access_token: Optional[str]):
+        if not self._flusher or self._flusher.done():
+            await self.aadd_message(session_id, role, content, user_id, access_token)
+            return
+
+        message_data = {
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "user_id": user_id,
+            # Stamped here so buffered rows keep their conversational order once written.
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self._pending.append((access_token, message_data))
+        self.cache.append(self.cache.key(session_id, user_id), role, content, message_data["created_at"])
+        if len(self._pending) >= self.max_pending:
+            logging.warning("Chat history write buffer is full; flushing inline.")
+            await self._aflush_with_retry()
+        elif len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start_flusher(self):
+        """Starts the background task that bulk-inserts buffered messages. Call from the app's event loop."""
+        if self._flusher and not self._flusher.done():
+            return
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._run_flusher())
+        logging.info("Chat history write-behind flusher started.")
+
+    async def stop_flusher(self):
+        """Stops the flusher and writes out everything still buffered."""
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        while self._pending:
+            if not await self._aflush_with_retry():
+                break
+        self._flusher = None
+        logging.info("Chat history write-behind flusher stopped.")
+
+    async def _run_flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while len(self._pending) >= self.batch_size:
+                    if not await self._aflush_with_retry():
+                        break
+                if self._pending:
+                    await self._aflush_with_retry()
+            except Exception as e:
+                logging.error(f"Chat history flusher error: {e}")
+
+    async def aflush(self) -> bool:
+        """
+        Writes up to one batch of buffered messages, one request per access token, in a single attempt.
+        Rows whose write fails are put back at the front of the buffer while there is room,
+        where `aclear_history` can still discard them. Returns False if any write failed.
+        """
+        async with self._flush_lock:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                return True
+
+            rows_by_token: Dict[Optional[str], List[Dict]] = {}
+            for access_token, row in batch:
+                rows_by_token.setdefault(access_token, []).append(row)
+
+            ok = True
+            for access_token, rows in rows_by_token.items():
+                try:
+                    with stage("history_flush"):
+                        await self.rest.ainsert(CHAT_MESSAGES_TABLE, rows, access_token=access_token)
+                    logging.info(f"Flushed {len(rows)} chat messages to Supabase.")
+                except Exception as e:
+                    logging.warning(f"Failed to flush {len(rows)} chat messages: {e}")
+                    ok = False
+                    self._requeue(access_token, rows)
+            return ok
+
+    async def _aflush_with_retry(self) -> bool:
+        """
+        Flushes one batch, retrying with exponential backoff. The backoff sleeps happen outside
+        the flush lock, so other flushes and history clears aren't held up while Supabase is down.
+        """
+        for attempt in range(self.max_retries + 1):
+            if await self.aflush():
+                return True
+            if attempt < self.max_retries:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        logging.error(f"Chat history flush still failing after {self.max_retries + 1} attempts; {len(self._pending)} messages remain buffered.")
+        return False
+
+    def _requeue(self, access_token: Optional[str], rows: List[Dict]):
+        room = self.max_pending - len(self._pending)
+        for row in reversed(rows[:max(room, 0)]):
+            self._pending.appendleft((access_token, row))
+        if len(rows) > room:
+            self.dropped_messages += len(rows) - max(room, 0)
+            logging.error(f"Dropped {len(rows) - max(room, 0)} chat messages: write buffer is full.")
+
+    def _pending_rows(self, session_id: Optional[str], user_id: Optional[str]) -> List[Dict]:
+        """Buffered rows that belong to the given user (or anonymous session)."""
+        if user_id:
+            return [row for _, row in self._pending if row["user_id"] == user_id]
+        return [row for _, row in self._pending if row["session_id"] == session_id and not row["user_id"]]
+
+    def _discard_pending(self, session_id: Optional[str], user_id: Optional[str]):
+        """Drops the cached and buffered rows of a cleared history, otherwise the flusher would write them back after the delete."""
+        self.cache.evict(self.cache.key(session_id, user_id))
+        doomed = {id(row) for row in self._pending_rows(session_id, user_id)}
+        if doomed:
+            self._pending = deque(item for item in self._pending if id(item[1]) not in doomed)
+
+    def _merge_pending(self, rows: List[Dict], session_id: str, user_id: Optional[str], limit: int) -> List[Dict]:
+        """Adds not-yet-flushed rows to rows read from Supabase so reads see our own writes."""
+        pending = self._pending_rows(session_id, user_id)
+        if not pending:
+            return rows
+        return sorted(rows + pending, key=lambda x: x['created_at'], reverse=True)[:limit]
+
     def get_history(self, session_id: str, user_id: Optional[str] = None, access_token: Optional[str] = None, limit: int = 5) -> List[Dict[str, str]]: # Changed return type
         """
         Retrieves chat history from the last 24 hours and returns it as a list of message dictionaries.
         It prioritizes fetching by user_id if available, otherwise falls back to session_id.
         Limits the number of messages returned to the 'limit' parameter (default 5).
+        Served from the in-process history cache when possible; Supabase is only read on a miss.
         """
-        supabase_client = self._get_authenticated_supabase_client(access_token)
-        if not supabase_client:
-            logging.error("Supabase client not available. Cannot get history.")
-            return [] # Return empty list instead of error string
+        since = self._history_cutoff()
+        cached = self.cache.get(self.cache.key(session_id, user_id), limit, since)
+        if cached is not None:
+            return cached
 
         try:
-            twenty_four_hours_ago = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
-            
-            query = self.supabase.table("chat_messages").select("role, content")
-
-            # Prioritize user_id for logged-in users
-            if user_id:
-                query = query.eq("user_id", user_id)
-            else:
-                # Fallback to session_id for anonymous users
-                query = query.eq("session_id", session_id)
-            
-            # Order by created_at descending to get the most recent messages, then limit
-            response = query.gte("created_at", twenty_four_hours_ago).order("created_at", desc=True).limit(limit).execute()
-
-            if not response.data:
-                return [] # Return empty list
+            fetch_limit = max(limit, self.cache.turns_per_session)
+            rows = self.rest.select(
+                CHAT_MESSAGES_TABLE,
+                columns="role,content,created_at",
+                filters=self._history_filters(session_id, user_id, since),
+                order="created_at.desc",
+                limit=fetch_limit,
+                access_token=access_token,
+            )
+            return self._fill_cache(rows, session_id, user_id, fetch_limit, limit)
+        except Exception as e:
+            logging.error(f"Error getting history from Supabase: {e}")
+            return [] # Return empty list on error
 
-            # Sort the messages chronologically before returning
-            ordered_messages = sorted(response.data, key=lambda x: x['created_at'])
+    async def aget_history(self, session_id: str, user_id: Optional[str] = None, access_token: Optional[str] = None, limit: int = 5) -> List[Dict[str, str]]:
+        """Async variant of `get_history`."""
+        since = self._history_cutoff()
+        cached = self.cache.get(self.cache.key(session_id, user_id), limit, since)
+        if cached is not None:
+            return cached
 
-            # Return list of dicts with only role and content
-            return [{"role": msg['role'], "content": msg['content']} for msg in ordered_messages]
+        try:
+            fetch_limit = max(limit, self.cache.turns_per_session)
+            rows = await self.rest.aselect(
+                CHAT_MESSAGES_TABLE,
+                columns="role,content,created_at",
+                filters=self._history_filters(session_id, user_id, since),
+                order="created_at.desc",
+                limit=fetch_limit,
+                access_token=access_token,
+            )
+            return self._fill_cache(rows, session_id, user_id, fetch_limit, limit)
         except Exception as e:
             logging.error(f"Error getting history from Supabase: {e}")
-            return [] # Return empty list on error
+            return []
+
+    def _fill_cache(self, rows: List[Dict], session_id: str, user_id: Optional[str], fetch_limit: int, limit: int) -> List[Dict[str, str]]:
+        """Caches a freshly read history (plus still-buffered rows) and returns its newest `limit` messages."""
+        newest_first = self._merge_pending(rows, session_id, user_id, fetch_limit)
+        chronological = sorted(newest_first, key=lambda x: x['created_at'])
+        # Fewer rows than requested means we have seen the owner's whole 24h window.
+        self.cache.fill(self.cache.key(session_id, user_id), chronological, complete=len(rows) < fetch_limit and len(newest_first) < fetch_limit)
+        return self._to_messages(chronological[-limit:] if limit > 0 else [])
 
     def clear_history(self, session_id: Optional[str] = None, user_id: Optional[str] = None, access_token: Optional[str] = None):
         """
         Clears chat history for a given session_id or user_id.
         Prioritizes user_id if provided.
         """
-        supabase_client = self._get_authenticated_supabase_client(access_token)
-        if not supabase_client:
-            logging.error("Supabase client not available. Cannot clear history.")
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Supabase client not available.")
+        if not user_id and not session_id:
+            raise ValueError("Either session_id or user_id must be provided to clear history.")
+
+        self._discard_pending(session_id, user_id)
+
+        try:
+            deleted = self.rest.delete(CHAT_MESSAGES_TABLE, self._owner_filter(session_id, user_id), access_token=access_token)
+            if user_id:
+                logging.info(f"Cleared history for user_id: {user_id}. Deleted {len(deleted)} messages.")
+            else:
+                logging.info(f"Cleared history for session_id: {session_id}. Deleted {len(deleted)} messages.")
+        except Exception as e:
+            logging.error(f"Error clearing history from Supabase: {e}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to clear history: {e}")
+
+    async def aclear_history(self, session_id: Optional[str] = None, user_id: Optional[str] = None, access_token: Optional[str] = None):
+        """Async variant of `clear_history`."""
+        if not user_id and not session_id:
+            raise ValueError("Either session_id or user_id must be provided to clear history.")
 
         try:
+            # Under the flush lock, so a batch being written right now can't land after the delete.
+            async with self._flush_lock or contextlib.nullcontext():
+                self._discard_pending(session_id, user_id)
+                deleted = await self.rest.adelete(CHAT_MESSAGES_TABLE, self._owner_filter(session_id, user_id), access_token=access_token)
             if user_id:
-                response = supabase_client.table("chat_messages").delete().eq("user_id", user_id).execute()
-                logging.info(f"Cleared history for user_id: {user_id}. Response: {response.data}")
-            elif session_id:
-                response = supabase_client.table("chat_messages").delete().eq("session_id", session_id).execute()
-                logging.info(f"Cleared history for session_id: {session_id}. Response: {response.data}")
+                logging.info(f"Cleared history for user_id: {user_id}. Deleted {len(deleted)} messages.")
             else:
-                raise ValueError("Either session_id or user_id must be provided to clear history.")
+                logging.info(f"Cleared history for session_id: {session_id}. Deleted {len(deleted)} messages.")
         except Exception as e:
             logging.error(f"Error clearing history from Supabase: {e}")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to clear history: {e}")
 
-# Singleton instance
-chat_history_service_instance = ChatHistoryService()
+# Singleton instance, built on first use
+@lazy
+def get_chat_history_service() -> ChatHistoryService:
+    return ChatHistoryService()
@@ -0,0 +1,139 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Set
+
+from langchain_core.documents import Document
+
+from app.utils.tokens import count_tokens
+
+_WORD = re.compile(r"\w+")
+
+
+def _source_label(doc: Document) -> str:
+    return str(doc.metadata.get("source", "Unknown Source")).split("/")[-1]
+
+
+def _page_label(doc: Document):
+    return doc.metadata.get("page_label", doc.metadata.get("page", "Unknown Page"))
+
+
+def _overlap(a: str, b: str, min_overlap: int) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if shorter than `min_overlap`)."""
+    if len(b) < min_overlap:
+        return 0
+    head = b[:min_overlap]
+    # Candidate starts are occurrences of b's head in a's tail; the earliest match is the longest overlap.
+    start = a.find(head, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(head, start + 1)
+    return 0
+
+
+@dataclass
+class _Block:
+    """One context entry: the merged text of chunks from a single source page."""
+    doc: Document
+    rank: int
+    pieces: List[str] = field(default_factory=list)
+    words: Set[str] = field(default_factory=set)
+    text: str = ""
+    tokens: int = 0
+
+
+class ContextPacker:
+    """
+    Turns retrieved chunks into a compact, token-budgeted prompt context.
+
+    1. Drops chunks whose text is already contained in a higher-ranked chunk.
+    2. Merges chunks from the same source page into one block, stitching the text
+       splitter's overlapping neighbours back together so the overlap appears once.
+    3. Orders blocks by MMR (retrieval rank vs. word overlap with already chosen
+       blocks), so near-duplicate passages don't crowd out other sources.
+    4. Adds blocks in that order until `token_budget` is reached (the top block is always kept).
+
+    `pack` returns one Document per block that made it into the context, which is what
+    the answer's sources are attributed to.
+    """
+
+    def __init__(self, token_budget: int = 1500, mmr_lambda: float = 0.7, min_overlap: int = 20,
+                 token_counter: Callable[[str], int] = count_tokens):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.min_overlap = min_overlap
+        self.count_tokens = token_counter
+
+    @staticmethod
+    def format_block(doc: Document) -> str:
+        return f"Content from {_source_label(doc)} (Page {_page_label(doc)}):\n{doc.page_content}"
+
+    def format(self, docs: List[Document]) -> str:
+        return "\n\n".join(self.format_block(doc) for doc in docs)
+
+    def pack(self, docs: List[Document]) -> List[Document]:
+        blocks = self._merge(docs)
+        selected: List[_Block] = []
+        used_tokens = 0
+        remaining = blocks
+        while remaining:
+            best = max(remaining, key=lambda block: self._mmr_score(block, selected, len(docs)))
+            remaining = [block for block in remaining if block is not best]
+            separator = 2 if selected else 0  # "\n\n" between blocks
+            if selected and used_tokens + separator + best.tokens > self.token_budget:
+                continue  # A smaller, lower-ranked block may still fit
+            selected.append(best)
+            used_tokens += separator + best.tokens
+        return [block.doc for block in selected]
+
+    def _merge(self, docs: List[Document]) -> List[_Block]:
+        blocks: dict = {}
+        seen_texts: List[str] = []
+        for rank, doc in enumerate(docs):
+            text = doc.page_content.strip()
+            if not text or any(text in seen for seen in seen_texts):
+                continue
+            seen_texts.append(text)
+            key = (_source_label(doc), _page_label(doc))
+            block = blocks.get(key)
+            if block is None:
+                block = blocks[key] = _Block(doc=doc, rank=rank)
+            self._add_piece(block, text)
+            block.words.update(_WORD.findall(text.casefold()))
+
+        for block in blocks.values():
+            merged = Document(id=block.doc.id, page_content="\n...\n".join(block.pieces), metadata=dict(block.doc.metadata))
+            block.doc = merged
+            block.text = self.format_block(merged)
+            block.tokens = self.count_tokens(block.text)
+        return list(blocks.values())
+
+    def _add_piece(self, block: _Block, text: str):
+        """Stitches `text` onto an existing piece it overlaps with, else adds it as a new piece."""
+        for i, piece in enumerate(block.pieces):
+            if text in piece:
+                return
+            merged = None
+            if piece in text:
+                merged = text
+            elif overlap := _overlap(piece, text, self.min_overlap):
+                merged = piece + text[overlap:]
+            elif overlap := _overlap(text, piece, self.min_overlap):
+                merged = text + piece[overlap:]
+            if merged is not None:
+                # The longer piece may now bridge to another one, so merge it again.
+                del block.pieces[i]
+                self._add_piece(block, merged)
+                return
+        block.pieces.append(text)
+
+    def _mmr_score(self, block: _Block, selected: List[_Block], total: int) -> float:
+        relevance = 1.0 - block.rank / max(total, 1)
+        redundancy = max((self._similarity(block, other) for other in selected), default=0.0)
+        return self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+
+    @staticmethod
+    def _similarity(a: _Block, b: _Block) -> float:
+        if not a.words or not b.words:
+            return 0.0
+        return len(a.words & b.words) / len(a.words | b.words)
@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.core.admission import AdmissionController, estimate_tokens
+from app.utils.tokens import count_tokens
+
+ROLE_LABELS = {"user": "Pengguna", "assistant": "Asisten"}
+_WHITESPACE = re.compile(r"\s+")
+
+SUMMARY_TEMPLATE = """
+Ringkas percakapan antara pengguna dan asisten AI Fakultas Teknik Universitas Hamzanwadi.
+Pertahankan fakta penting: pertanyaan pengguna, jawaban yang sudah diberikan, nama, tanggal dan angka.
+Tulis dalam Bahasa Indonesia, paling banyak {max_words} kata, tanpa pembuka.
+
+Ringkasan sebelumnya:
+{summary}
+
+Pesan baru:
+{messages}
+
+Ringkasan terbaru:
+"""
+
+
+def _fingerprint(message: Dict[str, str]) -> str:
+    return hashlib.sha1(f"{message['role']}\x00{message['content']}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Summary:
+    text: str
+    last_fingerprint: str  # Newest message folded into `text`
+
+
+class HistoryBuilder:
+    """
+    Formats chat history for the prompt within a token budget.
+
+    The newest messages are kept verbatim (whitespace collapsed, each capped at
+    `message_max_tokens`) for as long as they fit in `token_budget`. Older messages are
+    represented by a rolling summary per session, which is computed once and then folded
+    forward incrementally by a background LLM call whenever more messages fall out of
+    the window. A turn never waits for the summarizer: it uses the latest finished summary.
+    Summary calls take background slots on `admission`, so they only use the deployment's
+    quota that chat turns leave free.
+    """
+
+    def __init__(self, llm, token_budget: int = 600, message_max_tokens: int = 150, summary_max_tokens: int = 200,
+                 max_sessions: int = 10000, summarize: bool = True, admission: Optional[AdmissionController] = None):
+        self.token_budget = token_budget
+        self.message_max_tokens = message_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.max_sessions = max_sessions
+        self.summarize = summarize
+        self.admission = admission
+        self.summary_chain = ChatPromptTemplate.from_template(SUMMARY_TEMPLATE) | llm | StrOutputParser()
+        self._summaries: "OrderedDict[tuple, _Summary]" = OrderedDict()
+        self._updates: Dict[tuple, asyncio.Task] = {}
+
+    def build(self, key: tuple, messages: List[Dict[str, str]]) -> str:
+        """
+        Returns the prompt text for `messages` (chronological) of the session identified by `key`,
+        scheduling a summary update if older messages are not yet covered.
+        """
+        if not messages:
+            return ""
+        recent, older = self._split(messages)
+        lines = []
+        summary = self._valid_summary(key, older)
+        if summary:
+            lines.append(f"Ringkasan percakapan sebelumnya: {summary.text}")
+        lines.extend(self._format_message(message) for message in recent)
+        if older and self.summarize:
+            self._schedule_update(key, older, summary)
+        return "\n".join(lines)
+
+    def _format_message(self, message: Dict[str, str]) -> str:
+        content = _WHITESPACE.sub(" ", message["content"]).strip()
+        tokens = count_tokens(content)
+        if tokens > self.message_max_tokens:
+            content = content[:len(content) * self.message_max_tokens // tokens].rstrip() + " …"
+        return f"{ROLE_LABELS.get(message['role'], message['role'])}: {content}"
+
+    def _split(self, messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """Splits into (recent messages that fit the budget, older messages), both chronological."""
+        budget = self.token_budget - (self.summary_max_tokens if self.summarize else 0)
+        used = 0
+        start = len(messages)
+        while start > 0:
+            tokens = count_tokens(self._format_message(messages[start - 1])) + 1
+            if used + tokens > budget and start < len(messages):
+                break
+            used += tokens
+            start -= 1
+        return messages[start:], messages[:start]
+
+    def _valid_summary(self, key: tuple, older: List[Dict[str, str]]) -> Optional[_Summary]:
+        """The cached summary, if it still describes this session's older messages (not a cleared or expired history)."""
+        summary = self._summaries.get(key)
+        if summary is None:
+            return None
+        self._summaries.move_to_end(key)
+        if any(_fingerprint(message) == summary.last_fingerprint for message in older):
+            return summary
+        return None
+
+    def _schedule_update(self, key: tuple, older: List[Dict[str, str]], summary: Optional[_Summary]):
+        if key in self._updates:
+            return  # One update per session at a time; the next turn picks up anything missed
+        fingerprints = [_fingerprint(message) for message in older]
+        if summary:
+            last = len(fingerprints) - 1 - fingerprints[::-1].index(summary.last_fingerprint)
+            new_messages = older[last + 1:]
+        else:
+            new_messages = older
+        if not new_messages:
+            return
+        task = asyncio.create_task(self._update(key, summary.text if summary else "", new_messages, fingerprints[-1]))
+        self._updates[key] = task
+        task.add_done_callback(lambda _: self._updates.pop(key, None))
+
+    async def _update(self, key: tuple, previous: str, new_messages: List[Dict[str, str]], last_fingerprint: str):
+        inputs = {
+            "summary": previous or "(belum ada)",
+            "messages": "\n".join(self._format_message(message) for message in new_messages),
+            "max_words": self.summary_max_tokens * 3 // 4,
+        }
+        tokens = estimate_tokens(SUMMARY_TEMPLATE, inputs["summary"], inputs["messages"]) + self.summary_max_tokens
+        try:
+            async with self.admission.admit("background", tokens, background=True) if self.admission else contextlib.nullcontext():
+                text = await self.summary_chain.ainvoke(inputs)
+        except Exception as e:
+            logging.warning(f"Could not update the chat history summary: {e}")
+            return
+        self._summaries[key] = _Summary(text=_WHITESPACE.sub(" ", text).strip(), last_fingerprint=last_fingerprint)
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_sessions:
+            self._summaries.popitem(last=False)
+        logging.info(f"Folded {len(new_messages)} older messages into the chat history summary.")
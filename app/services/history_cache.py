@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+# (role, content, created_at ISO string): compact enough to keep thousands of sessions in memory.
+Turn = Tuple[str, str, str]
+HistoryKey = Tuple[str, str]
+
+
+@dataclass
+class _HistoryEntry:
+    turns: Deque[Turn]
+    expires_at: float
+    # True when `turns` holds every message of the owner's 24h window, not just the most recent ones.
+    complete: bool = False
+
+
+class SessionHistoryCache:
+    """
+    Read-through cache of recent chat turns, keyed by user_id (or session_id for anonymous users).
+
+    Each owner gets a bounded ring of its most recent turns. Entries are filled from
+    Supabase on a miss, appended to as messages are written, dropped when a history is
+    cleared, and evicted by TTL or LRU once `max_sessions` is exceeded.
+
+    Entries are not revalidated against Supabase: messages written or histories cleared by
+    another worker become visible only when the entry expires. With several workers, keep
+    `ttl_seconds` short, or route each session to a single worker before raising it.
+    """
+
+    def __init__(self, max_sessions: int = 10000, turns_per_session: int = 20, ttl_seconds: float = 5.0):
+        self.max_sessions = max_sessions
+        self.turns_per_session = turns_per_session
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[HistoryKey, _HistoryEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(session_id: Optional[str], user_id: Optional[str]) -> HistoryKey:
+        return ("user", user_id) if user_id else ("session", session_id)
+
+    def get(self, key: HistoryKey, limit: int, since: str) -> Optional[List[Dict[str, str]]]:
+        """Returns up to `limit` turns created at or after `since` (chronological), or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic() or not (entry.complete or len(entry.turns) >= limit):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            recent = [turn for turn in entry.turns if turn[2] >= since][-limit:] if limit > 0 else []
+        return [{"role": role, "content": content} for role, content, _ in recent]
+
+    def fill(self, key: HistoryKey, rows: List[Dict[str, str]], complete: bool):
+        """Stores rows read from Supabase (chronological order, each with `created_at`)."""
+        turns = deque(((row["role"], row["content"], row["created_at"]) for row in rows), maxlen=self.turns_per_session)
+        with self._lock:
+            self._entries[key] = _HistoryEntry(turns=turns, expires_at=time.monotonic() + self.ttl_seconds, complete=complete and len(rows) <= self.turns_per_session)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def append(self, key: HistoryKey, role: str, content: str, created_at: str):
+        """Records a newly written message, if the owner's history is cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if len(entry.turns) == entry.turns.maxlen:
+                entry.complete = False
+            entry.turns.append((role, content, created_at))
+
+    def evict(self, key: HistoryKey):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._entries), "hits": self.hits, "misses": self.misses}
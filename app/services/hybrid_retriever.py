@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.metrics import stage
+from app.services.lexical_index import BM25Index
+
+
+def _doc_key(doc: Document) -> str:
+    return doc.metadata.get("id") or doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], rrf_k: int = 60) -> List[Document]:
+    """
+    Merges ranked lists by summing 1 / (rrf_k + rank) per document.
+    Documents are matched by chunk ID; the first list's copy of a document is kept.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Runs vector search and BM25 lexical search concurrently and fuses them with
+    reciprocal rank fusion, so exact matches on course codes, names and acronyms
+    surface even when their embeddings are not close to the query's.
+    """
+
+    vector_retriever: BaseRetriever
+    lexical_index: BM25Index
+    k: int = 8
+    rrf_k: int = 60
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any) -> List[Document]:
+        vector_docs = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(vector_docs, self.lexical_index.search(query, self.k))
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, **kwargs: Any) -> List[Document]:
+        # BM25 runs on a worker thread while the query embedding / vector search is in flight.
+        vector_docs, lexical_hits = await asyncio.gather(
+            self._avector_search(query, run_manager),
+            asyncio.to_thread(self._lexical_search, query),
+        )
+        return self._fuse(vector_docs, lexical_hits)
+
+    async def _avector_search(self, query: str, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        with stage("vector_search"):  # Includes the query embedding
+            return await self.vector_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+
+    def _lexical_search(self, query: str):
+        with stage("lexical_search"):
+            return self.lexical_index.search(query, self.k)
+
+    def _fuse(self, vector_docs: List[Document], lexical_hits) -> List[Document]:
+        lexical_docs = [doc for doc, _ in lexical_hits]
+        return reciprocal_rank_fusion([vector_docs, lexical_docs], self.rrf_k)[:self.k]
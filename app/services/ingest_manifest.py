@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterable, Iterator, Set
+
+from langchain_core.documents import Document
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the per-source thread locks apply, and purges aren't excluded from ingests
+    fcntl = None
+
+
+def chunk_id(doc: Document) -> str:
+    """
+    Deterministic ID for a chunk, derived from its source, page and content.
+    Re-ingesting an unchanged chunk yields the same ID; any edit yields a new one.
+    Hex only, so it is a valid Azure AI Search document key.
+    """
+    source = str(doc.metadata.get("source", ""))
+    page = str(doc.metadata.get("page", ""))
+    digest = hashlib.sha256(f"{source}\x00{page}\x00{doc.page_content}".encode("utf-8"))
+    return digest.hexdigest()[:40]
+
+
+@contextmanager
+def _file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """Holds an advisory lock on `path` (created if missing) that other processes on the host respect too."""
+    with open(path, "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield  # Closing the file releases the lock
+
+
+class IngestManifest:
+    """
+    Persistent record of which chunk IDs each source currently has in the index.
+
+    Stored as JSON at `path`, namespaced by index name so several indexes can share a file.
+    Every read goes back to the file and every write merges into its latest content under a
+    file lock, so workers and replicas sharing the file don't overwrite each other's sources.
+    Writes are atomic (temp file + rename).
+
+    `lock_sources` serializes ingests of the same source (across processes, where `fcntl` is
+    available), and `lock_all` excludes every ingest while untracked chunks are purged.
+    """
+
+    def __init__(self, path: str, index_name: str):
+        self.path = path
+        self.index_name = index_name
+        self._lock = threading.Lock()
+        self._source_locks: Dict[str, threading.Lock] = {}
+        self._lock_dir = f"{path}.locks"
+        self._data: Dict[str, Dict[str, list]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, list]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read ingest manifest at {self.path}, starting empty: {e}")
+            return {}
+
+    def _lock_path(self, name: str) -> str:
+        os.makedirs(self._lock_dir, exist_ok=True)
+        return os.path.join(self._lock_dir, f"{name}.lock")
+
+    def _reload(self):
+        """Picks up what other processes wrote since this one last read the file. Call with `_lock` held."""
+        if os.path.exists(self.path):
+            self._data = self._load()
+
+    def chunk_ids(self, source: str) -> Set[str]:
+        with self._lock:
+            self._reload()
+            return set(self._data.get(self.index_name, {}).get(source, []))
+
+    def all_chunk_ids(self) -> Set[str]:
+        """Every chunk ID recorded for this index, across all sources."""
+        with self._lock:
+            self._reload()
+            return {chunk for ids in self._data.get(self.index_name, {}).values() for chunk in ids}
+
+    def sources(self) -> Set[str]:
+        with self._lock:
+            self._reload()
+            return set(self._data.get(self.index_name, {}))
+
+    def replace(self, source: str, ids: Iterable[str]):
+        """Records the full set of chunk IDs for `source` and persists the manifest, keeping other sources as saved."""
+        with self._lock, _file_lock(self._lock_path("manifest")):
+            self._reload()
+            self._data.setdefault(self.index_name, {})[source] = sorted(set(ids))
+            self._save()
+
+    @contextmanager
+    def lock_sources(self, sources: Iterable[str]) -> Iterator[None]:
+        """
+        Held for a whole ingest of `sources`: waits for other ingests of any of them (taken in sorted
+        order, so overlapping runs can't deadlock) and for a running `lock_all` purge.
+        """
+        with ExitStack() as stack:
+            stack.enter_context(_file_lock(self._lock_path("all"), shared=True))
+            for source in sorted(set(sources)):
+                with self._lock:
+                    thread_lock = self._source_locks.setdefault(source, threading.Lock())
+                stack.enter_context(thread_lock)
+                digest = hashlib.sha1(f"{self.index_name}\x00{source}".encode("utf-8")).hexdigest()[:20]
+                stack.enter_context(_file_lock(self._lock_path(f"source-{digest}")))
+            yield
+
+    @contextmanager
+    def lock_all(self) -> Iterator[None]:
+        """Held while purging untracked chunks: no ingest (whose new chunks aren't recorded yet) runs meanwhile."""
+        with _file_lock(self._lock_path("all")):
+            yield
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.path)
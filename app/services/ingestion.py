@@ -0,0 +1,171 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import openai
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+class IngestionCancelled(Exception):
+    """Raised inside an ingestion run once its cancel event is set."""
+
+
+@dataclass
+class IngestionStats:
+    """Progress counters for one ingestion run."""
+    docs_loaded: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_uploaded: int = 0
+    chunks_skipped: int = 0
+    chunks_deleted: int = 0
+    rate_limit_retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def chunks_per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        return self.chunks_uploaded / elapsed if elapsed > 0 else 0.0
+
+
+def _retry_after_seconds(error: openai.APIStatusError) -> Optional[float]:
+    """Reads the server's Retry-After hint from a 429 response, if any."""
+    headers = getattr(error.response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class IngestionEngine:
+    """
+    Embeds and uploads document chunks in pipelined batches.
+
+    Chunks are consumed lazily and grouped into embedding batches of `embed_batch_size`.
+    At most `max_concurrent_batches` embedding requests are in flight at once, and
+    429 / transient errors from the Azure OpenAI deployment are retried with exponential
+    backoff (honouring Retry-After). Embedded chunks are collected into upload batches of
+    `upload_batch_size` and sent to the vector store on a separate worker, so uploads
+    overlap with the next embedding requests.
+
+    Chunks whose `Document.id` is set are uploaded under that key, and `on_upload` (if given)
+    is called with each batch once the vector store has accepted it. If `cancel_event` is set
+    during a run, it stops before the next batch and raises `IngestionCancelled`.
+    """
+
+    def __init__(
+        self,
+        embedder: Embeddings,
+        vector_store,
+        embed_batch_size: int = 64,
+        max_concurrent_batches: int = 4,
+        upload_batch_size: int = 500,
+        max_retries: int = 6,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        on_upload: Optional[Callable[[List[Document]], None]] = None,
+    ):
+        self.embedder = embedder
+        self.vector_store = vector_store
+        self.embed_batch_size = embed_batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.upload_batch_size = upload_batch_size
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.on_upload = on_upload
+
+    def run(self, chunks: Iterable[Document], stats: Optional[IngestionStats] = None, cancel_event: Optional[threading.Event] = None) -> IngestionStats:
+        stats = stats or IngestionStats()
+        pending_embeddings: deque[Future] = deque()
+        pending_uploads: deque[Future] = deque()
+        upload_buffer: List[Tuple[Document, List[float]]] = []
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_batches, thread_name_prefix="ingest-embed") as embed_pool, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-upload") as upload_pool:
+
+            def drain_one_embedding():
+                batch, vectors = pending_embeddings.popleft().result()
+                stats.chunks_embedded += len(batch)
+                upload_buffer.extend(zip(batch, vectors))
+                while len(upload_buffer) >= self.upload_batch_size:
+                    submit_upload(upload_buffer[:self.upload_batch_size])
+                    del upload_buffer[:self.upload_batch_size]
+
+            def submit_upload(items: List[Tuple[Document, List[float]]]):
+                # Keep at most one upload queued behind the running one to bound memory.
+                while len(pending_uploads) >= 2:
+                    stats.chunks_uploaded += pending_uploads.popleft().result()
+                pending_uploads.append(upload_pool.submit(self._upload, items))
+
+            for batch in self._batches(chunks):
+                if cancel_event and cancel_event.is_set():
+                    for future in pending_embeddings:
+                        future.cancel()
+                    raise IngestionCancelled()
+                stats.chunks_total += len(batch)
+                if len(pending_embeddings) >= self.max_concurrent_batches:
+                    drain_one_embedding()
+                pending_embeddings.append(embed_pool.submit(self._embed, batch, stats))
+
+            while pending_embeddings:
+                drain_one_embedding()
+            if upload_buffer:
+                submit_upload(upload_buffer)
+            while pending_uploads:
+                stats.chunks_uploaded += pending_uploads.popleft().result()
+
+        stats.finished_at = time.monotonic()
+        logging.info(
+            f"Ingested {stats.chunks_uploaded} chunks in {stats.elapsed_seconds:.1f}s "
+            f"({stats.chunks_per_second:.1f} chunks/sec, {stats.rate_limit_retries} rate-limit retries)."
+        )
+        return stats
+
+    def _batches(self, chunks: Iterable[Document]) -> Iterator[List[Document]]:
+        iterator = iter(chunks)
+        while batch := list(islice(iterator, self.embed_batch_size)):
+            yield batch
+
+    def _embed(self, batch: List[Document], stats: IngestionStats) -> Tuple[List[Document], List[List[float]]]:
+        texts = [doc.page_content for doc in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                return batch, self.embedder.embed_documents(texts)
+            except (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt) * random.uniform(0.5, 1.0)
+                if isinstance(e, openai.RateLimitError):
+                    stats.rate_limit_retries += 1
+                    delay = max(delay, _retry_after_seconds(e) or 0)
+                logging.warning(f"Embedding batch failed ({type(e).__name__}); retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}).")
+                time.sleep(delay)
+
+    def _upload(self, items: List[Tuple[Document, List[float]]]) -> int:
+        docs = [doc for doc, _ in items]
+        keys = [doc.id for doc in docs] if all(doc.id for doc in docs) else None
+        self.vector_store.add_embeddings(
+            [(doc.page_content, vector) for doc, vector in items],
+            metadatas=[doc.metadata for doc in docs],
+            keys=keys,
+        )
+        if self.on_upload:
+            self.on_upload(docs)
+        return len(items)
@@ -0,0 +1,121 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Callable, Optional
+
+from app.core.config import settings
+from app.services.ingestion import IngestionCancelled, IngestionStats
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    description: str
+    status: JobStatus = JobStatus.QUEUED
+    stats: IngestionStats = field(default_factory=IngestionStats)
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    future: Optional[Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+# An ingestion task receives the job's stats to update and an event that is set on cancellation.
+IngestionTask = Callable[[IngestionStats, threading.Event], object]
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion jobs on a dedicated, bounded worker pool, away from the threads
+    that serve requests, and keeps their status and progress for the jobs API.
+    Only the most recent `max_jobs_retained` finished jobs are remembered.
+    """
+
+    def __init__(self, max_workers: int = 2, max_jobs_retained: int = 200):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_jobs_retained = max_jobs_retained
+
+    def submit(self, task: IngestionTask, description: str, cleanup: Optional[Callable[[], None]] = None) -> IngestionJob:
+        """Queues `task`; `cleanup` always runs once the job ends, even if it is cancelled before starting."""
+        job = IngestionJob(id=str(uuid.uuid4()), description=description)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.future = self._executor.submit(self._run, job, task)
+        if cleanup:
+            job.future.add_done_callback(lambda _: cleanup())
+        logging.info(f"Ingestion job {job.id} queued: {description}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[IngestionJob]:
+        """Cancels a queued job immediately, or asks a running one to stop at the next batch."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.cancel_event.set()
+        if job.future and job.future.cancel():
+            self._finish(job, JobStatus.CANCELLED)
+        return job
+
+    def shutdown(self):
+        """Cancels queued and running jobs and waits for the workers to stop."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if not job.finished:
+                self.cancel(job.id)
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job: IngestionJob, task: IngestionTask):
+        if job.cancel_event.is_set():
+            self._finish(job, JobStatus.CANCELLED)
+            return
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.now(timezone.utc)
+        try:
+            task(job.stats, job.cancel_event)
+            self._finish(job, JobStatus.SUCCEEDED)
+        except IngestionCancelled:
+            self._finish(job, JobStatus.CANCELLED)
+        except Exception as e:
+            logging.error(f"Ingestion job {job.id} failed: {e}")
+            job.error = str(e)
+            self._finish(job, JobStatus.FAILED)
+
+    def _finish(self, job: IngestionJob, job_status: JobStatus):
+        job.status = job_status
+        job.finished_at = datetime.now(timezone.utc)
+        logging.info(f"Ingestion job {job.id} {job_status.value}.")
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.max_jobs_retained, 0)]:
+            del self._jobs[job_id]
+
+
+# Singleton instance
+ingestion_job_manager = IngestionJobManager(max_workers=settings.INGEST_MAX_JOBS, max_jobs_retained=settings.INGEST_JOBS_RETAINED)
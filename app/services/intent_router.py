@@ -0,0 +1,108 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+# Canned answers, worded as in the rules of the RAG prompt.
+GREETING_ANSWER = "Halo! Saya asisten AI Fakultas Teknik Universitas Hamzanwadi. Ada yang bisa saya bantu?"
+THANKS_ANSWER = "Sama-sama! Ada lagi yang bisa saya bantu?"
+OFF_TOPIC_ANSWER = "Maaf, saya hanya dapat membantu pertanyaan seputar Fakultas Teknik Universitas Hamzanwadi. Ada yang bisa saya bantu terkait fakultas?"
+
+_GREETING_WORDS = {
+    "halo", "hallo", "helo", "hai", "hi", "hey", "hello", "tes", "test", "testing", "ping", "p", "permisi",
+    "assalamualaikum", "assalamu", "alaikum", "salam", "selamat", "pagi", "siang", "sore", "malam",
+    "good", "morning", "afternoon", "evening",
+}
+_THANKS_WORDS = {"terima", "kasih", "makasih", "trims", "thanks", "thank", "you", "thx", "tq", "ok", "oke", "okay", "sip", "mantap", "baik"}
+# Forms of address that can accompany a greeting or thanks without changing its intent.
+_FILLER_WORDS = {"min", "admin", "kak", "kakak", "bot", "pak", "bu", "bang", "gan", "ya", "yaa", "banyak", "semua", "wr", "wb", "dan", "aja"}
+
+# Queries that mention something the faculty documents could cover always go to the RAG chain ...
+_DOMAIN = re.compile(
+    r"\b(fakultas|teknik|kampus|kuliah|mahasiswa|dosen|prodi|jurusan|universitas|hamzanwadi|pendaftaran|"
+    r"beasiswa|skripsi|tugas akhir|lab|laboratorium|krs|khs|sks|semester|ukt|wisuda|akademik|himpunan|bem|ormawa|ukm|organisasi|"
+    r"toefl|lulus|kelulusan|nilai|ipk|ujian|uts|uas|sidang|yudisium|ijazah|transkrip|praktikum|magang|kkn|kerja praktek|"
+    r"kurikulum|mata kuliah|matkul|kelas|jadwal|cuti|dekan|kaprodi|rektor|alumni|akreditasi|sertifikat|lomba|kompetisi|pmb)"
+)
+# ... otherwise these are clearly outside the faculty's scope. Words with a campus meaning too
+# ("skor" TOEFL, "slot" sidang, "presiden" BEM, "film" course) only count in unambiguous phrases.
+_OFF_TOPIC = re.compile(
+    r"\b(resep|zodiak|horoskop|ramalan (?:bintang|cuaca)|prakiraan cuaca|cuaca (?:hari ini|besok)|lirik|chord|klasemen|drakor|anime|"
+    r"sepak ?bola|piala dunia|liga (?:inggris|champions|spanyol|italia)|skor (?:pertandingan|bola)|"
+    r"bitcoin|crypto|kripto|forex|togel|judi|slot (?:gacor|online)|pacar|gebetan|jodoh|puisi|pantun|cerpen|pilpres|capres)\b"
+)
+_WORD = re.compile(r"[a-z]+")
+_REPEATS = re.compile(r"(.)\1+")
+_MAX_SMALL_TALK_WORDS = 6
+
+
+def _normalize_word(word: str) -> str:
+    """Collapses stretched spellings of unknown words ("halooo", "makasihhh") to their base form."""
+    if word in _GREETING_WORDS or word in _THANKS_WORDS or word in _FILLER_WORDS:
+        return word
+    return _REPEATS.sub(r"\1", word)
+
+
+@dataclass
+class RoutedAnswer:
+    intent: str
+    answer: str
+
+
+class IntentRouter:
+    """
+    Rule-based classifier that answers greetings, thanks and obvious off-topic questions
+    from templates, so they skip history, retrieval and the LLM entirely.
+
+    Rules are deliberately conservative: small talk must consist only of greeting/thanks
+    words (plus forms of address), faculty terms are checked before the off-topic list,
+    and that list only holds words and phrases with no campus meaning.
+    Anything else is left to the RAG chain. Keeps counters of what it short-circuits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.routed = {"greeting": 0, "thanks": 0, "off_topic": 0}
+
+    def classify(self, query: str) -> Optional[str]:
+        text = query.casefold()
+        words = [_normalize_word(word) for word in _WORD.findall(text)]
+        if not words:
+            return None
+        if len(words) <= _MAX_SMALL_TALK_WORDS:
+            content = [word for word in words if word not in _FILLER_WORDS]
+            if content and all(word in _GREETING_WORDS for word in content):
+                return "greeting"
+            if content and all(word in _THANKS_WORDS for word in content):
+                return "thanks"
+        if _DOMAIN.search(text):
+            return None
+        if _OFF_TOPIC.search(text):
+            return "off_topic"
+        return None
+
+    def route(self, query: str) -> Optional[RoutedAnswer]:
+        """Returns a templated answer if the query doesn't need the RAG chain, else None."""
+        intent = self.classify(query)
+        with self._lock:
+            self.total += 1
+            if intent:
+                self.routed[intent] += 1
+            routed, total = sum(self.routed.values()), self.total
+        if not intent:
+            return None
+        logging.info(f"Intent router answered a '{intent}' query from a template ({routed}/{total} queries short-circuited, {routed / total:.1%}).")
+        answer = {"greeting": GREETING_ANSWER, "thanks": THANKS_ANSWER, "off_topic": OFF_TOPIC_ANSWER}[intent]
+        return RoutedAnswer(intent=intent, answer=answer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            routed = sum(self.routed.values())
+            return {
+                "total": self.total,
+                "short_circuited": routed,
+                "short_circuit_rate": routed / self.total if self.total else 0.0,
+                **self.routed,
+            }
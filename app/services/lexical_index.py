@@ -0,0 +1,186 @@
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+_WORD = re.compile(r"\w+")
+# Codes and acronyms written with separators ("TIF-2103", "S.T.", "K3/LH") also index as one token.
+_COMPOUND = re.compile(r"\w+(?:[-./]\w+)+")
+
+
+def tokenize(text: str) -> List[str]:
+    text = text.casefold()
+    tokens = _WORD.findall(text)
+    tokens.extend(re.sub(r"[-./]", "", compound) for compound in _COMPOUND.findall(text))
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring over ingested chunks.
+
+    Postings map term -> {chunk_id: term frequency}; chunk texts and metadata are kept so
+    hits can be returned as Documents. Persisted as JSON at `path` (postings are rebuilt on
+    load). Adding an existing chunk ID replaces it. Call `save()` after a batch of changes.
+
+    With several workers, only the one that ran an ingest changes its in-memory index, so
+    `refresh` (run by `search`, and by RAGService before each chat turn) checks the file's mtime
+    and size at most every `reload_interval` seconds and reloads it when another process has
+    saved a newer version; `on_reload` then runs.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, reload_interval: float = 0.0):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.reload_interval = reload_interval
+        self.on_reload: Optional[Callable[[], None]] = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._docs: Dict[str, Tuple[str, dict]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._file_version: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of the file loaded or saved here
+        self._dirty = False  # Changes not saved yet; a reload would lose them
+        self._next_check = time.monotonic() + reload_interval
+        self._load()
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._docs
+
+    def count(self) -> int:
+        return len(self._docs)
+
+    def add(self, docs: Iterable[Document]):
+        """Indexes documents under their `Document.id`."""
+        with self._lock:
+            self._dirty = True
+            for doc in docs:
+                self._add(doc.id, doc.page_content, doc.metadata)
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            self._dirty = True
+            for chunk_id in ids:
+                self._remove(chunk_id)
+
+    def _add(self, chunk_id: str, text: str, metadata: dict):
+        self._remove(chunk_id)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[chunk_id] = tf
+        length = sum(terms.values())
+        self._docs[chunk_id] = (text, metadata)
+        self._lengths[chunk_id] = length
+        self._total_length += length
+
+    def _remove(self, chunk_id: str):
+        if chunk_id not in self._docs:
+            return
+        text, _ = self._docs.pop(chunk_id)
+        self._total_length -= self._lengths.pop(chunk_id)
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int = 8) -> List[Tuple[Document, float]]:
+        """Returns the top-k chunks by BM25 score, best first."""
+        self.refresh()
+        with self._lock:
+            n = len(self._docs)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._document(chunk_id), score) for chunk_id, score in top]
+
+    def _document(self, chunk_id: str) -> Document:
+        text, metadata = self._docs[chunk_id]
+        return Document(id=chunk_id, page_content=text, metadata={"id": chunk_id, **metadata})
+
+    def refresh_due(self) -> bool:
+        """True once `reload_interval` seconds have passed since the last check for a newer file."""
+        return bool(self.path) and self.reload_interval > 0 and time.monotonic() >= self._next_check
+
+    def refresh(self, force: bool = False):
+        """
+        Reloads the index if another process saved a newer file (checked at most every
+        `reload_interval` seconds, or right away with `force`).
+        """
+        if not self.path or not (force or self.refresh_due()):
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return  # Another thread is already checking; search the current index meanwhile
+        try:
+            self._next_check = time.monotonic() + self.reload_interval
+            version = self._stat()
+            if self._dirty or version is None or version == self._file_version:
+                return
+            # Rebuilt off the search lock, then swapped in whole.
+            fresh = BM25Index(self.path, self.k1, self.b)
+            with self._lock:
+                if self._dirty:
+                    return
+                self._docs, self._lengths, self._postings = fresh._docs, fresh._lengths, fresh._postings
+                self._total_length, self._file_version = fresh._total_length, fresh._file_version
+            logging.info(f"Reloaded the lexical index from {self.path}: {len(fresh._docs)} chunks.")
+            if self.on_reload:
+                self.on_reload()
+        finally:
+            self._reload_lock.release()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        self._file_version = self._stat()  # Taken before reading, so a concurrent rewrite is picked up next time
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read lexical index at {self.path}, starting empty: {e}")
+            return
+        for chunk_id, (text, metadata) in data.items():
+            self._add(chunk_id, text, metadata)
+
+    def save(self):
+        """Persists the indexed chunks atomically (temp file + rename)."""
+        if not self.path:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._docs, f)
+            os.replace(tmp_path, self.path)
+            self._file_version = self._stat()
+            self._dirty = False
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
+
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+COMPACT_SUFFIX = ".compact"
+COMPACT_MARKER = "compact.done"  # Present once a compacted pair is fully written and only needs swapping in
+COMPACT_MIN_DEAD_ROWS = 256  # Below this, dead rows cost less to score than the rewrite
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store backed by a memory-mapped float32 matrix on disk.
+
+    Vectors are L2-normalized on write and appended to `vectors.f32`; texts, metadata and
+    deletions are appended to `records.jsonl`, which is replayed on startup. Search is a
+    single matrix-vector product over the memory map followed by an `argpartition` top-k,
+    so small indexes answer in well under a millisecond without any network hop.
+
+    Adding an existing ID replaces it (the old row is tombstoned). Once more than
+    `compact_dead_fraction` of the rows are tombstoned, both files are rewritten with only
+    the live rows, so repeated re-ingests don't grow the index or slow search. Mirrors the parts of
+    the AzureSearch API that RAGService relies on: `add_embeddings(..., keys=...)`,
+    `delete(ids)` and `as_retriever(k=...)`.
+    """
+
+    def __init__(self, embedding: Embeddings, path: str, compact_dead_fraction: float = 0.3):
+        self.embedding = embedding
+        self.path = path
+        self.compact_dead_fraction = compact_dead_fraction
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, VECTORS_FILE)
+        self._records_path = os.path.join(path, RECORDS_FILE)
+        self._marker_path = os.path.join(path, COMPACT_MARKER)
+        self._lock = threading.RLock()  # Guards the snapshot searches read; held only for swaps
+        self._write_lock = threading.RLock()  # Serializes writers (adds, deletes, compaction)
+        self._dim: Optional[int] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._row_by_id: dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._matrix: Optional[np.ndarray] = None
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def count(self) -> int:
+        """Number of live (non-deleted) vectors."""
+        return int(self._alive.sum())
+
+    def ids(self) -> List[str]:
+        """IDs of the live vectors."""
+        with self._write_lock:  # Writers update the ID map in place
+            return list(self._row_by_id)
+
+    # --- Persistence ---
+
+    def _load(self):
+        if os.path.exists(self._marker_path):
+            self._swap_in_compacted()  # A compaction was interrupted after its files were complete
+        else:
+            for leftover in (self._vectors_path + COMPACT_SUFFIX, self._records_path + COMPACT_SUFFIX):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        if not os.path.exists(self._records_path):
+            return
+        alive: List[bool] = []
+        with open(self._records_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["op"] == "add":
+                    self._dim = record["dim"]
+                    if record["id"] in self._row_by_id:
+                        alive[self._row_by_id[record["id"]]] = False
+                    self._row_by_id[record["id"]] = len(self._ids)
+                    self._ids.append(record["id"])
+                    self._texts.append(record["text"])
+                    self._metadatas.append(record["metadata"])
+                    alive.append(True)
+                elif record["op"] == "delete" and record["id"] in self._row_by_id:
+                    alive[self._row_by_id.pop(record["id"])] = False
+        # Rows whose record was written but whose vector write was interrupted are dropped.
+        rows_on_disk = os.path.getsize(self._vectors_path) // (4 * self._dim) if self._dim else 0
+        del self._ids[rows_on_disk:], self._texts[rows_on_disk:], self._metadatas[rows_on_disk:]
+        self._row_by_id = {doc_id: row for doc_id, row in self._row_by_id.items() if row < rows_on_disk}
+        self._alive = np.array(alive[:rows_on_disk], dtype=bool)
+        self._remap()
+
+    def _remap(self):
+        rows = len(self._ids)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim)) if rows else None
+
+    # --- Writes ---
+
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]], metadatas: Optional[List[dict]] = None, *, keys: Optional[List[str]] = None) -> List[str]:
+        """Appends (or replaces, by key) pre-computed embeddings."""
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        keys = keys or [os.urandom(16).hex() for _ in text_embeddings]
+        metadatas = metadatas or [{} for _ in text_embeddings]
+
+        with self._write_lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index dimension {self._dim}.")
+
+            alive = np.concatenate([self._alive, np.ones(len(keys), dtype=bool)])
+            with open(self._vectors_path, "ab") as vectors_file, open(self._records_path, "a", encoding="utf-8") as records_file:
+                vectors_file.write(vectors.tobytes())
+                for key, (text, _), metadata in zip(keys, text_embeddings, metadatas):
+                    if key in self._row_by_id:
+                        alive[self._row_by_id[key]] = False
+                    self._row_by_id[key] = len(self._ids)
+                    self._ids.append(key)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                    records_file.write(json.dumps({"op": "add", "id": key, "dim": self._dim, "text": text, "metadata": metadata}) + "\n")
+            # Swap in new arrays rather than mutating, so concurrent searches see a consistent snapshot.
+            with self._lock:
+                self._alive = alive
+                self._remap()
+            self._maybe_compact()
+        return keys
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self.embedding.embed_documents(texts)), metadatas, keys=ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> bool:
+        if not ids:
+            return False
+        with self._write_lock:
+            alive = self._alive.copy()
+            deleted = 0
+            with open(self._records_path, "a", encoding="utf-8") as records_file:
+                for doc_id in ids:
+                    row = self._row_by_id.pop(doc_id, None)
+                    if row is not None:
+                        alive[row] = False
+                        deleted += 1
+                        records_file.write(json.dumps({"op": "delete", "id": doc_id}) + "\n")
+            with self._lock:
+                self._alive = alive
+            self._maybe_compact()
+        return deleted > 0
+
+    # --- Compaction ---
+
+    def _maybe_compact(self):
+        dead = len(self._alive) - self.count()
+        if dead >= COMPACT_MIN_DEAD_ROWS and dead > self.compact_dead_fraction * len(self._alive):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the vectors and records with only the live rows. The new pair is written next to
+        the old one and committed by a marker file before being swapped in, so a crash at any
+        point leaves either the old index or a compaction that `_load` finishes.
+        Searches keep running on the old files until the swap.
+        """
+        with self._write_lock:
+            if self._matrix is None:
+                return
+            live = np.flatnonzero(self._alive)
+            ids = [self._ids[row] for row in live]
+            texts = [self._texts[row] for row in live]
+            metadatas = [self._metadatas[row] for row in live]
+            with open(self._vectors_path + COMPACT_SUFFIX, "wb") as vectors_file:
+                for start in range(0, len(live), 4096):
+                    vectors_file.write(np.ascontiguousarray(self._matrix[live[start:start + 4096]]).tobytes())
+                vectors_file.flush()
+                os.fsync(vectors_file.fileno())
+            with open(self._records_path + COMPACT_SUFFIX, "w", encoding="utf-8") as records_file:
+                for key, text, metadata in zip(ids, texts, metadatas):
+                    records_file.write(json.dumps({"op": "add", "id": key, "dim": self._dim, "text": text, "metadata": metadata}) + "\n")
+                records_file.flush()
+                os.fsync(records_file.fileno())
+            open(self._marker_path, "w").close()
+            self._swap_in_compacted()
+
+            dropped = len(self._ids) - len(ids)
+            # New lists rather than in-place edits: searches still holding the old snapshot keep their row numbers.
+            with self._lock:
+                self._ids, self._texts, self._metadatas = ids, texts, metadatas
+                self._row_by_id = {key: row for row, key in enumerate(ids)}
+                self._alive = np.ones(len(ids), dtype=bool)
+                self._remap()
+        logging.info(f"Compacted the local vector store: dropped {dropped} deleted rows, {len(ids)} remain.")
+
+    def _swap_in_compacted(self):
+        for path in (self._vectors_path, self._records_path):
+            if os.path.exists(path + COMPACT_SUFFIX):
+                os.replace(path + COMPACT_SUFFIX, path)
+        os.remove(self._marker_path)
+
+    # --- Search ---
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        with self._lock:
+            matrix, alive = self._matrix, self._alive
+            rows = (self._ids, self._texts, self._metadatas)
+        if matrix is None or not alive.any():
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = matrix @ query
+        scores[~alive] = -np.inf
+        k = min(k, int(alive.sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._document(rows, row), float(scores[row])) for row in top]
+
+    @staticmethod
+    def _document(rows: Tuple[List[str], List[str], List[dict]], row: int) -> Document:
+        ids, texts, metadatas = rows
+        # Like AzureSearch results, the document key is exposed as metadata["id"].
+        return Document(id=ids[row], page_content=texts[row], metadata={"id": ids[row], **metadatas[row]})
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        # Only the embedding is remote; the search itself is fast enough to run inline.
+        return self.similarity_search_by_vector(await self.embedding.aembed_query(query), k)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(await self.embedding.aembed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1) / 2
+
+    def as_retriever(self, k: int = 4, **kwargs: Any) -> VectorStoreRetriever:
+        """Accepts `k` directly, like AzureSearch.as_retriever."""
+        kwargs.setdefault("search_kwargs", {}).setdefault("k", k)
+        return super().as_retriever(**kwargs)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, path: str = "data/vector_store", **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding, path)
+        store.add_texts(texts, metadatas, ids=kwargs.get("ids"))
+        return store
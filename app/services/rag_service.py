@@ -1,40 +1,136 @@
-from typing import Optional
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+import asyncio
 import logging
+import threading
+import time
 from fastapi import HTTPException, status
-from langchain_community.vectorstores.azuresearch import AzureSearch
+from langchain_community.vectorstores.azuresearch import FIELDS_ID, AzureSearch
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
 
-from app.core.clients import azure_llm, azure_embedder
+from app.core.admission import client_key, estimate_tokens, set_client_key
+from app.core.clients import get_azure_llm, get_cached_azure_embedder, get_llm_admission
 from app.core.config import settings
+from app.core.embedding_cache import CachedEmbeddings
+from app.core.metrics import record_stage, stage, token_usage_callback
 from app.schemas.chat import ChatResponse, Source
-from app.services.chat_history_service import chat_history_service_instance
+from app.services.answer_cache import CachedAnswer, SemanticAnswerCache
+from app.services.chat_history_service import get_chat_history_service
+from app.services.context_packer import ContextPacker
+from app.services.history_builder import HistoryBuilder
+from app.services.history_cache import SessionHistoryCache
+from app.services.hybrid_retriever import HybridRetriever
+from app.services.ingest_manifest import IngestManifest, chunk_id
+from app.services.ingestion import IngestionCancelled, IngestionEngine, IngestionStats
+from app.services.intent_router import IntentRouter, RoutedAnswer
+from app.services.lexical_index import BM25Index
+from app.services.local_vector_store import LocalVectorStore
+from app.services.single_flight import Flight, SingleFlight
+from app.utils.lazy import lazy
+
+MAX_INDEX_BATCH_ACTIONS = 1000  # Azure AI Search limit on actions per indexing request
+
+def _snippet(text: str) -> str:
+    """Shortens a chunk to SOURCE_SNIPPET_CHARS, cutting at a word boundary."""
+    text = " ".join(text.split())
+    if len(text) <= settings.SOURCE_SNIPPET_CHARS:
+        return text
+    return text[:settings.SOURCE_SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+
+@dataclass
+class PreparedTurn:
+    """Everything gathered for a chat turn before the LLM is called."""
+    chat_history: list
+    history_text: str = ""
+    relevant_docs: list = field(default_factory=list)
+    context_string: str = ""
+    query_embedding: Optional[List[float]] = None
+    cache_version: int = 0
+    cached: Optional[CachedAnswer] = None
+    client: str = "anonymous"  # Admission control key: the user, or the session for anonymous chats
 
 class RAGService:
     def __init__(self):
-        self.llm = azure_llm
-        self.embedder = azure_embedder
-        self.index_name = settings.AZURE_AI_SEARCH_INDEX_NAME
+        self.llm = get_azure_llm().with_config(callbacks=[token_usage_callback])  # Token usage for /metrics
+        # Query embeddings go through an LRU + TTL cache; document embeddings pass straight through.
+        self.embedder = get_cached_azure_embedder()
+        self.lexical_index = BM25Index(settings.LEXICAL_INDEX_PATH, reload_interval=settings.LEXICAL_INDEX_RELOAD_SECONDS)
+        # The manifest is kept per index, so each backend tracks its own ingested chunks.
+        self.index_name = settings.AZURE_AI_SEARCH_INDEX_NAME if settings.VECTOR_STORE_BACKEND == "azure" else f"local:{settings.LOCAL_VECTOR_STORE_PATH}"
         
+        self.vector_store = None
+        self.retriever = None
         try:
-            self.vector_store = AzureSearch(
+            self.connect_vector_store()
+        except Exception as e:
+            logging.error(f"Could not initialize the '{settings.VECTOR_STORE_BACKEND}' vector store. Error: {e}")
+        
+        self.rag_chain = self._build_rag_chain()
+        self.history_service = get_chat_history_service()
+        # Bounds LLM calls in flight against the deployment's quota; query embeddings have their own controller.
+        self.llm_admission = get_llm_admission()
+        self.manifest = IngestManifest(settings.INGEST_MANIFEST_PATH, self.index_name)
+        self.intent_router = IntentRouter()
+        self.history_builder = HistoryBuilder(
+            self.llm,
+            token_budget=settings.HISTORY_TOKEN_BUDGET,
+            message_max_tokens=settings.HISTORY_MESSAGE_MAX_TOKENS,
+            summary_max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS,
+            max_sessions=settings.HISTORY_CACHE_MAX_SESSIONS,
+            summarize=settings.HISTORY_SUMMARY_ENABLED,
+            admission=self.llm_admission,
+        )
+        self.context_packer = ContextPacker(token_budget=settings.CONTEXT_TOKEN_BUDGET, mmr_lambda=settings.CONTEXT_MMR_LAMBDA)
+        # Identical concurrent questions share one search and, when history-free, one LLM call.
+        self.retrieval_flights = SingleFlight("retrieval")
+        self.generation_flights = SingleFlight("generation")
+        self.answer_cache = SemanticAnswerCache(
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+        )
+        # Another worker's ingest shows up here as a lexical index reload (see `_arefresh_index`); answers cached against the old index go.
+        self.lexical_index.on_reload = self.answer_cache.invalidate
+
+    def connect_vector_store(self):
+        """
+        Builds the vector store and retriever, raising if the backend can't be reached.
+        Called again by the readiness recovery when the first attempt failed.
+        """
+        vector_store = self._build_vector_store()
+        self.retriever = self._build_retriever(vector_store)
+        self.vector_store = vector_store
+        logging.info(f"Vector store ready (backend: {settings.VECTOR_STORE_BACKEND}).")
+
+    def _build_vector_store(self) -> VectorStore:
+        """
+        Builds the vector store selected by VECTOR_STORE_BACKEND. Any backend must support
+        `add_embeddings(..., keys=...)`, `delete(ids=...)` and `as_retriever(k=...)`.
+        """
+        backend = settings.VECTOR_STORE_BACKEND
+        if backend == "local":
+            return LocalVectorStore(self.embedder, settings.LOCAL_VECTOR_STORE_PATH, compact_dead_fraction=settings.LOCAL_VECTOR_STORE_COMPACT_DEAD_FRACTION)
+        if backend == "azure":
+            return AzureSearch(
                 azure_search_endpoint=settings.AZURE_AI_SEARCH_ENDPOINT,
                 azure_search_key=settings.AZURE_AI_SEARCH_KEY,
                 index_name=self.index_name,
-                embedding_function=self.embedder.embed_query,
+                embedding_function=self.embedder,
             )
-            self.retriever = self.vector_store.as_retriever(k=8) # Optimized k value
-            logging.info("Successfully connected to Azure AI Search.")
-        except Exception as e:
-            logging.error(f"Could not connect to Azure AI Search. Error: {e}")
-            self.vector_store = None
-            self.retriever = None
-        
-        self.rag_chain = self._build_rag_chain()
-        self.history_service = chat_history_service_instance
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{backend}'; expected 'azure' or 'local'.")
+
+    def _build_retriever(self, vector_store: VectorStore) -> BaseRetriever:
+        vector_retriever = vector_store.as_retriever(k=settings.RETRIEVER_K)
+        if not settings.HYBRID_RETRIEVAL_ENABLED:
+            return vector_retriever
+        return HybridRetriever(vector_retriever=vector_retriever, lexical_index=self.lexical_index, k=settings.RETRIEVER_K, rrf_k=settings.RRF_K)
 
     def _build_rag_chain(self):
         """Builds the RAG chain with a unified prompt."""
@@ -68,80 +164,484 @@ class RAGService:
             | StrOutputParser()
         )
 
-    def ingest_data(self, file_paths: list[str] = None, urls: list[str] = None):
-        """Ingests data from PDF files and URLs, creates embeddings, and adds them to Azure AI Search."""
+    def ingest_data(self, file_paths: list[str] = None, urls: list[str] = None, source_names: Optional[dict[str, str]] = None,
+                    stats: Optional[IngestionStats] = None, cancel_event: Optional[threading.Event] = None):
+        """
+        Ingests data from PDF files and URLs, creates embeddings, and adds them to the vector store.
+        Documents are streamed page by page through split -> embed -> upload, so memory stays flat
+        regardless of file size. `source_names` maps a file path to the source name to record
+        (e.g. the original filename of an upload stored under a temporary name).
+        Incremental: chunks already recorded in the ingest manifest are skipped, and chunks a
+        source no longer produces are deleted from the index. The BM25 lexical index is kept
+        in step with the vector store (and backfilled for unchanged chunks it is missing).
+        Progress is recorded in `stats`; setting `cancel_event` stops the run at the next batch.
+        Ingests of the same source run one at a time, across workers too, so a run never
+        deletes or forgets chunks another run of that source just uploaded.
+        """
         if not self.vector_store:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Azure AI Search is not available. Please check the configuration."
+                detail="Vector store is not available. Please check the configuration."
             )
 
         if not file_paths and not urls:
             raise ValueError("Either file_paths or urls must be provided.")
 
-        docs = []
-        if file_paths:
-            for path in file_paths:
-                loader = PyPDFLoader(path)
-                docs.extend(loader.load())
+        # The source each input's chunks are recorded under (PDFs by path or given name, web pages by URL)
+        sources = [(source_names or {}).get(path, path) for path in file_paths or []] + list(urls or [])
+        with self.manifest.lock_sources(sources):
+            return self._ingest(file_paths, urls, source_names, stats or IngestionStats(), cancel_event)
+
+    def _ingest(self, file_paths: Optional[list[str]], urls: Optional[list[str]], source_names: Optional[dict[str, str]],
+                stats: IngestionStats, cancel_event: Optional[threading.Event]) -> IngestionStats:
+        # Start from the latest saved lexical index, so the save below keeps other workers' chunks.
+        self.lexical_index.refresh(force=True)
+        known_ids: dict[str, set[str]] = {}
+        seen_ids: dict[str, set[str]] = {}
+
+        def new_chunks() -> Iterator[Document]:
+            for doc in self._iter_chunks(file_paths, urls, source_names, stats):
+                source = doc.metadata.get("source", "Unknown")
+                if source not in known_ids:
+                    known_ids[source] = self.manifest.chunk_ids(source)
+                    seen_ids[source] = set()
+                doc.id = chunk_id(doc)
+                if doc.id in seen_ids[source]:
+                    continue  # identical chunks collapse into one
+                seen_ids[source].add(doc.id)
+                if doc.id in known_ids[source]:
+                    stats.chunks_skipped += 1
+                    if doc.id not in self.lexical_index:
+                        self.lexical_index.add([doc])
+                    continue
+                yield doc
+
+        logging.info("Ingesting new or changed chunks into the vector store...")
+        try:
+            self._build_ingestion_engine().run(new_chunks(), stats, cancel_event)
+
+            if not stats.docs_loaded:
+                logging.info("No documents loaded. Ingestion skipped.")
+                return stats
+
+            failed = []
+            for source, ids in seen_ids.items():
+                try:
+                    self._delete_stale_chunks(source, sorted(known_ids[source] - ids), ids, stats)
+                except Exception as e:
+                    logging.error(f"Could not delete stale chunks of '{source}': {e}")
+                    failed.append(e)
+            if failed:
+                raise failed[0]
+        finally:
+            # Whatever reached the vector store is searchable lexically too, even if the run failed.
+            self.lexical_index.save()
+
+        if stats.chunks_uploaded or stats.chunks_deleted:
+            # The index changed, so drop every answer cached against the old one.
+            self.answer_cache.invalidate()
         
-        if urls:
-            loader = WebBaseLoader(urls)
-            docs.extend(loader.load())
+        logging.info(f"Ingestion complete: {stats.chunks_uploaded} uploaded, {stats.chunks_skipped} unchanged, {stats.chunks_deleted} stale chunks deleted.")
+        return stats
 
-        if not docs:
-            logging.info("No documents loaded. Ingestion skipped.")
-            return
+    def purge_untracked_chunks(self, stats: Optional[IngestionStats] = None, cancel_event: Optional[threading.Event] = None) -> IngestionStats:
+        """
+        Deletes every chunk in the vector store that the ingest manifest doesn't track: copies left
+        by ingests from before the manifest (random keys), and chunks of runs that failed before
+        recording them. Re-ingest every source first, or content that only exists as untracked
+        chunks disappears from the index. No ingest runs meanwhile.
+        """
+        if not self.vector_store:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Vector store is not available. Please check the configuration."
+            )
+
+        stats = stats or IngestionStats()
+        with self.manifest.lock_all():
+            tracked = self.manifest.all_chunk_ids()
+            if not tracked:
+                raise ValueError("The ingest manifest tracks no chunks for this index; re-ingest the sources before purging.")
+            untracked = [key for key in self._index_chunk_ids() if key not in tracked]
+            logging.info(f"Purging {len(untracked)} untracked chunks from the vector store ({len(tracked)} tracked).")
+            batch_size = min(settings.INGEST_UPLOAD_BATCH_SIZE, MAX_INDEX_BATCH_ACTIONS)
+            try:
+                for start in range(0, len(untracked), batch_size):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise IngestionCancelled()
+                    batch = untracked[start:start + batch_size]
+                    self.vector_store.delete(ids=batch)
+                    self.lexical_index.delete(batch)
+                    stats.chunks_deleted += len(batch)
+            finally:
+                if stats.chunks_deleted:
+                    self.lexical_index.save()
+                    self.answer_cache.invalidate()
+        logging.info(f"Purge complete: {stats.chunks_deleted} untracked chunks deleted.")
+        return stats
+
+    def _index_chunk_ids(self) -> List[str]:
+        """Keys of every chunk in the vector store."""
+        if isinstance(self.vector_store, LocalVectorStore):
+            return self.vector_store.ids()
+        return [result[FIELDS_ID] for result in self.vector_store.client.search(search_text="*", select=[FIELDS_ID])]
+
+    def _delete_stale_chunks(self, source: str, stale_ids: list[str], live_ids: set[str], stats: IngestionStats):
+        """
+        Deletes a source's stale chunks in batches (Azure AI Search rejects index batches over
+        1000 actions), then records the source's current chunks in the manifest. If a batch fails,
+        the manifest keeps the stale ids not yet deleted, so the next run retries them instead of orphaning them.
+        """
+        batch_size = min(settings.INGEST_UPLOAD_BATCH_SIZE, MAX_INDEX_BATCH_ACTIONS)
+        for start in range(0, len(stale_ids), batch_size):
+            batch = stale_ids[start:start + batch_size]
+            try:
+                self.vector_store.delete(ids=batch)
+            except Exception:
+                self.manifest.replace(source, live_ids | set(stale_ids[start:]))
+                raise
+            self.lexical_index.delete(batch)
+            stats.chunks_deleted += len(batch)
+        self.manifest.replace(source, live_ids)
 
+    def _iter_chunks(self, file_paths: Optional[list[str]], urls: Optional[list[str]], source_names: Optional[dict[str, str]], stats: IngestionStats) -> Iterator[Document]:
+        """Lazily loads documents one page at a time and yields their chunks."""
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50)
-        split_docs = text_splitter.split_documents(docs)
 
-        logging.info(f"Ingesting {len(split_docs)} document chunks into Azure AI Search...")
-        
-        self.vector_store.add_documents(documents=split_docs)
-        
-        logging.info("Ingestion complete.")
+        def pages() -> Iterator[Document]:
+            for path in file_paths or []:
+                for page in PyPDFLoader(path).lazy_load():
+                    if source_names and path in source_names:
+                        page.metadata["source"] = source_names[path]
+                    yield page
+            if urls:
+                yield from WebBaseLoader(urls).lazy_load()
+
+        for page in pages():
+            stats.docs_loaded += 1
+            yield from text_splitter.split_documents([page])
+
+    def _build_ingestion_engine(self) -> IngestionEngine:
+        return IngestionEngine(
+            self.embedder,
+            self.vector_store,
+            embed_batch_size=settings.INGEST_EMBED_BATCH_SIZE,
+            max_concurrent_batches=settings.INGEST_MAX_CONCURRENT_BATCHES,
+            upload_batch_size=settings.INGEST_UPLOAD_BATCH_SIZE,
+            max_retries=settings.INGEST_MAX_RETRIES,
+            backoff_base_seconds=settings.INGEST_BACKOFF_BASE_SECONDS,
+            backoff_max_seconds=settings.INGEST_BACKOFF_MAX_SECONDS,
+            on_upload=self.lexical_index.add,
+        )
 
     def _format_docs(self, docs):
         if not docs:
             return "Tidak ada konteks yang relevan ditemukan."
-        formatted_docs = []
-        for i, doc in enumerate(docs):
-            source = doc.metadata.get('source', 'Unknown Source').split('/')[-1]
-            page = doc.metadata.get('page_label', doc.metadata.get('page', 'Unknown Page'))
-            formatted_docs.append(f"Content from {source} (Page {page}):\n{doc.page_content}")
-        return "\n\n".join(formatted_docs)
+        return self.context_packer.format(docs)
 
     def get_answer(self, query: str, session_id: str, user_id: Optional[str] = None, access_token: Optional[str] = None) -> ChatResponse:
-        logging.info(f"get_answer method called with query: {query}")
-        if not self.retriever:
+        """
+        Synchronous convenience wrapper around `aget_answer` for scripts and notebooks.
+        Must not be called from inside a running event loop; API handlers should await `aget_answer`.
+        """
+        return asyncio.run(self.aget_answer(query=query, session_id=session_id, user_id=user_id, access_token=access_token))
+
+    async def aget_answer(self, query: str, session_id: str, user_id: Optional[str] = None, access_token: Optional[str] = None, debug: bool = False) -> ChatResponse:
+        """
+        Answers a query without blocking the event loop.
+        Retrieval, history loading and generation are all awaited, so a single worker can keep many chats in flight.
+        `debug` adds the retrieved documents and the prompt context to the response as `debug_info`.
+        """
+        logging.info(f"aget_answer method called with query: {query}")
+        routed = self._route(query)
+        if routed:
+            return ChatResponse(answer=routed.answer, sources=[], session_id=session_id, debug_info={"intent": routed.intent} if debug else None)
+
+        self.llm_admission.check(client_key(user_id, session_id))  # Shed load before spending a retrieval on it
+        turn = await self._aprepare(query, session_id, user_id, access_token)
+        return await self._agenerate(query, turn, session_id, debug)
+
+    async def abatch_answer(self, queries: List[str], session_id: str, max_concurrency: int = 8) -> AsyncIterator[Tuple[int, object]]:
+        """
+        Answers many independent, history-free queries, yielding `(index, ChatResponse)` in completion order.
+        A failed item yields `(index, exception)` instead of failing the batch.
+
+        All query embeddings are fetched up front in one batched call (priming the query embedding cache
+        used by retrieval and the answer cache), retrievals run concurrently (up to 4x `max_concurrency`,
+        so they stay ahead of generation without flooding the search service), and at most
+        `max_concurrency` LLM calls are in flight at once; those calls queue for LLM admission as one client,
+        so a batch shares the deployment fairly with interactive users. Answers land in the semantic answer cache, so a batch also pre-warms it.
+        """
+        routed = {index: self._route(query) for index, query in enumerate(queries)}
+        if isinstance(self.embedder, CachedEmbeddings):
+            to_embed = [query for index, query in enumerate(queries) if not routed[index]]
+            set_client_key(client_key(None, session_id))  # The batched embedding queues for admission as the batch's client
+            try:
+                if to_embed:
+                    await self.embedder.aembed_queries(to_embed)
+            except Exception as e:
+                logging.warning(f"Batched query embedding failed, embedding queries one by one: {e}")
+
+        retrieval_slots = asyncio.Semaphore(max_concurrency * 4)
+        llm_slots = asyncio.Semaphore(max_concurrency)
+
+        async def answer(index: int, query: str) -> Tuple[int, object]:
+            try:
+                if routed[index]:
+                    return index, ChatResponse(answer=routed[index].answer, sources=[], session_id=session_id)
+                async with retrieval_slots:
+                    turn = await self._aprepare(query, session_id, None, None, load_history=False)
+                async with llm_slots:
+                    return index, await self._agenerate(query, turn, session_id, max_queued=max_concurrency)
+            except Exception as e:
+                return index, e
+
+        tasks = [asyncio.create_task(answer(index, query)) for index, query in enumerate(queries)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _agenerate(self, query: str, turn: PreparedTurn, session_id: str, debug: bool = False, max_queued: Optional[int] = None) -> ChatResponse:
+        """
+        Produces the response for a prepared turn: the cached answer, or a fresh one from the LLM.
+        `max_queued` overrides how many of this client's LLM calls may wait for admission at once.
+        """
+        if turn.cached:
+            return ChatResponse(answer=turn.cached.answer, sources=turn.cached.sources, session_id=session_id, cache_hit=True)
+
+        inputs = {
+            "context": turn.context_string,
+            "chat_history": turn.history_text,
+            "question": query
+        }
+        with stage("llm"):
+            produce = lambda _: self._ainvoke_llm(inputs, turn.client, max_queued)
+            joined = self._join_generation(query, turn, produce)
+            while joined:
+                flight, leader = joined
+                try:
+                    answer = await flight.result()
+                    break
+                except HTTPException as e:
+                    if not self._rejected_for_leader(e, leader):
+                        raise
+                    joined = self._join_generation(query, turn, produce)
+            else:
+                leader = True
+                answer = await self._ainvoke_llm(inputs, turn.client, max_queued)
+
+        response = self._build_response(answer, turn.relevant_docs, turn.context_string, session_id, debug)
+        if leader:
+            self._store_in_answer_cache(turn, answer, response.sources)
+        return response
+
+    async def astream_answer(self, query: str, session_id: str, user_id: Optional[str] = None, access_token: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Streams an answer as a sequence of events:
+        one `sources` event, then a `token` event per chunk from the LLM as it arrives.
+        The caller is responsible for the closing event and for persisting history.
+        """
+        logging.info(f"astream_answer method called with query: {query}")
+        routed = self._route(query)
+        if routed:
+            yield {"event": "sources", "data": []}
+            yield {"event": "token", "data": routed.answer}
+            return
+
+        self.llm_admission.check(client_key(user_id, session_id))
+        turn = await self._aprepare(query, session_id, user_id, access_token)
+        if turn.cached:
+            yield {"event": "sources", "data": [source.model_dump() for source in turn.cached.sources]}
+            yield {"event": "token", "data": turn.cached.answer}
+            return
+
+        sources = self._build_sources(turn.relevant_docs)
+        yield {"event": "sources", "data": [source.model_dump() for source in sources]}
+
+        inputs = {
+            "context": turn.context_string,
+            "chat_history": turn.history_text,
+            "question": query
+        }
+
+        async def produce(flight: Flight) -> str:
+            async for token in self._astream_llm(inputs, turn.client):
+                if token:
+                    flight.publish(token)
+            return "".join(flight.tokens)
+
+        tokens = []
+        start = time.perf_counter()
+        with stage("llm"):
+            # Followers of a shared call replay the tokens streamed so far, then follow the leader's stream.
+            joined = self._join_generation(query, turn, produce)
+            while True:
+                leader = joined[1] if joined else True
+                try:
+                    async for token in joined[0].stream() if joined else self._astream_llm(inputs, turn.client):
+                        if token:
+                            if not tokens:
+                                record_stage("llm_first_token", time.perf_counter() - start)
+                            tokens.append(token)
+                            yield {"event": "token", "data": token}
+                    break
+                except HTTPException as e:
+                    if tokens or not self._rejected_for_leader(e, leader):
+                        raise
+                    joined = self._join_generation(query, turn, produce)
+        if leader:
+            self._store_in_answer_cache(turn, "".join(tokens), sources)
+
+    def _route(self, query: str) -> Optional[RoutedAnswer]:
+        """Templated answer for small talk and off-topic queries, if the intent router is enabled."""
+        return self.intent_router.route(query) if settings.INTENT_ROUTER_ENABLED else None
+
+    async def _arefresh_index(self):
+        """
+        Picks up an ingest run by another worker before the answer cache is consulted. Every ingest
+        saves the lexical index file, with or without hybrid retrieval, so a newer file means the
+        index changed: it is reloaded and `on_reload` drops the answers cached against the old one.
+        """
+        if self.lexical_index.refresh_due():
+            await asyncio.to_thread(self.lexical_index.refresh)
+
+    async def _aprepare(self, query: str, session_id: str, user_id: Optional[str], access_token: Optional[str], load_history: bool = True) -> PreparedTurn:
+        """
+        Loads chat history and retrieves documents concurrently, each under its own timeout,
+        so the turn waits for the slower of the two rather than their sum.
+        With `load_history=False` the turn is treated as the start of a conversation.
+        History-free turns are checked against the semantic answer cache first;
+        on a hit the in-flight retrieval is cancelled.
+        """
+        await self._arefresh_index()
+        cache_version = self.answer_cache.index_version
+        client = client_key(user_id, session_id)
+        set_client_key(client)  # Query embedding misses below queue for admission under this client
+        history_task = asyncio.create_task(self._aload_history(session_id, user_id, access_token)) if load_history else None
+        retrieval_task = asyncio.create_task(self._aretrieve(query)) if self.retriever else None
+        try:
+            chat_history, history_loaded = await history_task if history_task else ([], True)
+            turn = PreparedTurn(chat_history=chat_history, cache_version=cache_version, client=client)
+            with stage("prompt_build"):
+                turn.history_text = self.history_builder.build(SessionHistoryCache.key(session_id, user_id), chat_history)
+
+            # Only history-free turns are cacheable; follow-up answers depend on the conversation.
+            if settings.ANSWER_CACHE_ENABLED and history_loaded and not chat_history:
+                turn.query_embedding = await self.embedder.aembed_query(query)
+                turn.cached = self.answer_cache.lookup(turn.query_embedding)
+                if turn.cached:
+                    logging.info("Semantic answer cache hit.")
+                    return turn
+
+            if retrieval_task is None:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Vector store is not available. Please check configuration and ingest data."
+                )
+
+            # Only the packed chunks reach the prompt, so they are also what sources are attributed to.
+            retrieved = await retrieval_task
+            with stage("prompt_build"):
+                turn.relevant_docs = self.context_packer.pack(retrieved)
+                turn.context_string = self._format_docs(turn.relevant_docs)
+            return turn
+        finally:
+            for task in (history_task, retrieval_task):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Don't leave an unobserved exception behind
+
+    async def _aload_history(self, session_id: str, user_id: Optional[str], access_token: Optional[str]) -> Tuple[list, bool]:
+        """Returns (chat_history, loaded). A slow history backend degrades to an empty history instead of failing the turn."""
+        try:
+            with stage("history_fetch"):
+                chat_history = await asyncio.wait_for(
+                    self.history_service.aget_history(session_id=session_id, user_id=user_id, access_token=access_token, limit=settings.HISTORY_FETCH_MESSAGES),
+                    timeout=settings.HISTORY_TIMEOUT_SECONDS,
+                )
+            return chat_history, True
+        except asyncio.TimeoutError:
+            logging.warning(f"Chat history lookup timed out after {settings.HISTORY_TIMEOUT_SECONDS}s; answering without history.")
+            return [], False
+
+    async def _aretrieve(self, query: str) -> list:
+        """Retrieves documents for `query`; concurrent requests for the same normalized query share one search."""
+        with stage("retrieval"):
+            if not settings.COALESCE_IDENTICAL_QUERIES:
+                return await self._aretrieve_once(query)
+            flight, _ = self.retrieval_flights.join(CachedEmbeddings.normalize(query), lambda _: self._aretrieve_once(query))
+            return await flight.result()
+
+    async def _aretrieve_once(self, query: str) -> list:
+        try:
+            return await asyncio.wait_for(self.retriever.ainvoke(query), timeout=settings.RETRIEVAL_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logging.error(f"Document retrieval timed out after {settings.RETRIEVAL_TIMEOUT_SECONDS}s.")
             raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Vector store is not available. Please check configuration and ingest data."
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Document retrieval timed out. Please try again."
             )
 
-        # Use the new `invoke` method to avoid deprecation warnings
-        relevant_docs = self.retriever.invoke(query)
-        context_string = self._format_docs(relevant_docs)
-        chat_history = self.history_service.get_history(session_id=session_id, user_id=user_id, access_token=access_token)
+    def _llm_tokens(self, inputs: dict) -> int:
+        """Tokens an LLM call is admitted for: its prompt inputs plus the full completion budget."""
+        return estimate_tokens(*inputs.values()) + settings.LLM_MAX_COMPLETION_TOKENS
 
-        answer = self.rag_chain.invoke({
-            "context": context_string, 
-            "chat_history": chat_history,
-            "question": query
-        })
+    async def _ainvoke_llm(self, inputs: dict, client: str, max_queued: Optional[int] = None) -> str:
+        async with self.llm_admission.admit(client, self._llm_tokens(inputs), max_queued):
+            return await self.rag_chain.ainvoke(inputs)
 
-        sources = [
-            Source(
-                source=doc.metadata.get('source', 'Unknown'),
-                content=doc.page_content
-            ) for doc in relevant_docs
-        ]
+    async def _astream_llm(self, inputs: dict, client: str) -> AsyncIterator[str]:
+        """Streams from the LLM, holding the admission slot until the stream ends."""
+        async with self.llm_admission.admit(client, self._llm_tokens(inputs)):
+            async for token in self.rag_chain.astream(inputs):
+                yield token
+
+    def _join_generation(self, query: str, turn: PreparedTurn, produce) -> Optional[Tuple[Flight, bool]]:
+        """
+        Joins the shared LLM call for a history-free turn with the same normalized query and context,
+        starting it with `produce` if none is running. Returns (flight, is_leader), or None for turns
+        that must be generated on their own.
+        """
+        if not settings.COALESCE_IDENTICAL_QUERIES or turn.chat_history or turn.history_text:
+            return None
+        return self.generation_flights.join((CachedEmbeddings.normalize(query), turn.context_string), produce)
+
+    @staticmethod
+    def _rejected_for_leader(error: HTTPException, leader: bool) -> bool:
+        """
+        True when a shared LLM call failed on its leader's admission limits (429) rather than on the call
+        itself. A follower then rejoins, leading a new call under its own client or following another.
+        """
+        return not leader and error.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    def _store_in_answer_cache(self, turn: PreparedTurn, answer: str, sources: List[Source]):
+        if turn.query_embedding is not None and answer:
+            self.answer_cache.put(turn.query_embedding, answer, sources, turn.cache_version)
+
+    def _build_sources(self, relevant_docs) -> list[Source]:
+        """One compact source per document page: name, page and a short snippet of the text."""
+        sources = {}
+        for doc in relevant_docs:
+            source = doc.metadata.get('source', 'Unknown')
+            page = doc.metadata.get('page_label', doc.metadata.get('page'))
+            page = str(page) if page is not None else None
+            if (source, page) not in sources:
+                sources[(source, page)] = Source(source=source, page=page, snippet=_snippet(doc.page_content))
+        return list(sources.values())
+
+    def _build_response(self, answer: str, relevant_docs, context_string: str, session_id: str, debug: bool = False) -> ChatResponse:
+        sources = self._build_sources(relevant_docs)
 
         debug_info = {
-            "relevant_docs": [doc.dict() for doc in relevant_docs],
+            "relevant_docs": [doc.model_dump() for doc in relevant_docs],
             "context_string": context_string
-        }
+        } if debug else None
 
         return ChatResponse(
             answer=answer, 
@@ -151,6 +651,8 @@ class RAGService:
         )
 
 # --- Singleton Instance ---
-# Create a single, reusable instance of the RAGService.
-# This is more efficient than creating a new instance for every request.
-rag_service_instance = RAGService()
+# A single, reusable instance of the RAGService, built on first use (normally by the warm-up
+# in app.main) so that importing this module doesn't connect to Azure.
+@lazy
+def get_rag_service() -> RAGService:
+    return RAGService()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.core.metrics import singleflight_calls
+
+
+class Flight:
+    """
+    One in-flight call shared by every request that joined it.
+
+    The producer may `publish()` tokens as they arrive; `stream()` replays what was already
+    published and then follows along, so late joiners of a streamed answer get every token.
+    `result()` waits for the final value. Errors are re-raised to every participant.
+    When the last participant stops waiting before the call finishes, `on_abandon` runs.
+    """
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self.on_abandon: Optional[Callable[[], None]] = None
+        self._changed = asyncio.Event()
+        self._waiting = 0
+
+    def publish(self, token: str):
+        self.tokens.append(token)
+        self._notify()
+
+    def _finish(self, value: Any = None, error: Optional[BaseException] = None):
+        self.value = value
+        self.error = error
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _leave(self):
+        self._waiting -= 1
+        if self._waiting == 0 and not self.done and self.on_abandon:
+            self.on_abandon()
+
+    async def result(self) -> Any:
+        self._waiting += 1
+        try:
+            while not self.done:
+                await self._changed.wait()
+        finally:
+            self._leave()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Yields every published token. A producer that published nothing yields its final value once."""
+        sent = 0
+        self._waiting += 1
+        try:
+            while True:
+                while sent < len(self.tokens):
+                    sent += 1
+                    yield self.tokens[sent - 1]
+                if self.done:
+                    break
+                await self._changed.wait()
+        finally:
+            self._leave()
+        if self.error is not None:
+            raise self.error
+        if not self.tokens and self.value:
+            yield self.value
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one producer call.
+
+    The first caller for a key (the leader) starts the producer as its own task, so a
+    leader that disconnects or is cancelled doesn't fail the requests that joined it.
+    Callers arriving while it runs (followers) share its result. If every participant
+    goes away first, the producer is cancelled. Nothing is cached: once the producer
+    finishes, the next call for the key starts a new flight.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage  # Label for the metrics
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def join(self, key: Hashable, produce: Callable[[Flight], Awaitable[Any]]) -> Tuple[Flight, bool]:
+        """Returns (flight, is_leader), starting `produce(flight)` if no flight for `key` is running."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            singleflight_calls.inc(stage=self.stage, role="follower")
+            return flight, False
+        flight = Flight()
+        self._flights[key] = flight
+        flight.on_abandon = lambda: self._abandon(key, flight)
+        flight.task = asyncio.create_task(self._run(key, flight, produce))
+        singleflight_calls.inc(stage=self.stage, role="leader")
+        return flight, True
+
+    async def _run(self, key: Hashable, flight: Flight, produce: Callable[[Flight], Awaitable[Any]]):
+        try:
+            flight._finish(value=await produce(flight))
+        except Exception as e:
+            flight._finish(error=e)
+        except BaseException:
+            # Don't hand a CancelledError to followers, which would look like their own cancellation
+            flight._finish(error=RuntimeError(f"The shared {self.stage} call was interrupted."))
+            raise
+        finally:
+            self._forget(key, flight)
+
+    def _abandon(self, key: Hashable, flight: Flight):
+        """Nobody is waiting any more: cancel the call, and let new callers start afresh meanwhile."""
+        self._forget(key, flight)
+        flight.task.cancel()
+        logging.info(f"Cancelled a shared {self.stage} call that nobody is waiting for.")
+
+    def _forget(self, key: Hashable, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict
+
+from app.core.clients import get_azure_llm, get_cached_azure_embedder, get_supabase_client, get_supabase_rest_client
+from app.core.config import settings
+from app.services.chat_history_service import CHAT_MESSAGES_TABLE
+from app.services.rag_service import get_rag_service
+from app.utils.tokens import count_tokens
+
+# Checks that must pass before the worker should receive chat traffic; the rest only degrade latency.
+READINESS_CHECKS = ("rag_service", "vector_store")
+
+
+async def _step(name: str, awaitable: Awaitable) -> bool:
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(awaitable, timeout=settings.WARMUP_TIMEOUT_SECONDS)
+    except Exception as e:
+        logging.warning(f"Warm-up step '{name}' failed: {e!r}")
+        return False
+    logging.info(f"Warm-up step '{name}' done in {time.perf_counter() - start:.2f}s.")
+    return True
+
+
+async def _rag_service():
+    rag = await asyncio.to_thread(get_rag_service)
+    if rag.retriever is None:
+        await asyncio.to_thread(rag.connect_vector_store)
+
+
+async def _embeddings():
+    # The uncached embedder, so the warm-up text doesn't take a slot in the query cache
+    embedder = await asyncio.to_thread(get_cached_azure_embedder)
+    await embedder.embedder.aembed_query("warm-up")
+
+
+async def warm_up() -> Dict[str, bool]:
+    """
+    Builds the shared clients and services and opens their remote connections concurrently,
+    so the first requests don't pay for it. Every step is best-effort and bounded by
+    WARMUP_TIMEOUT_SECONDS. Returns {check: passed}.
+    """
+    start = time.perf_counter()
+    steps = {
+        "rag_service": asyncio.to_thread(get_rag_service),  # Vector store connection, lexical index, manifest
+        "chat_model": asyncio.to_thread(get_azure_llm),
+        "embeddings": _embeddings(),
+        "supabase_auth": asyncio.to_thread(get_supabase_client),
+        "supabase_rest": get_supabase_rest_client().awarm_up(CHAT_MESSAGES_TABLE),
+        "tokenizer": asyncio.to_thread(count_tokens, "warm-up"),
+    }
+    results = await asyncio.gather(*(_step(name, awaitable) for name, awaitable in steps.items()))
+    checks = {**dict(zip(steps, results)), **readiness()}
+    logging.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s: {checks}")
+    return checks
+
+
+def readiness() -> Dict[str, bool]:
+    """Current state of READINESS_CHECKS, read from the live singletons rather than the warm-up result."""
+    built = get_rag_service.built
+    # The service still starts when its vector store can't be reached, but can't answer chats.
+    return {"rag_service": built, "vector_store": built and get_rag_service().retriever is not None}
+
+
+async def recover_readiness(warmup: "asyncio.Task[Dict[str, bool]]"):
+    """
+    After warm-up, retries the failed readiness steps with exponential backoff until they pass,
+    so a backend that was down at start-up doesn't keep the worker out of rotation for good.
+    """
+    try:
+        await warmup
+    except asyncio.CancelledError:
+        return
+    delay = 1.0
+    while not all(readiness().values()):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.WARMUP_RETRY_MAX_SECONDS)
+        await _step("rag_service", _rag_service())
+    logging.info("Readiness checks pass.")
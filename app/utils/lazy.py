@@ -0,0 +1,45 @@
+import functools
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class lazy(Generic[T]):
+    """
+    Turns a no-argument factory into a getter that builds the instance on first call and
+    returns the same instance afterwards. Safe to call from several threads at once:
+    the factory runs exactly once.
+
+    `set()` replaces the instance (e.g. with a stand-in in benchmarks) and `reset()`
+    forgets it so the next call builds a fresh one.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._instance: Optional[T] = None
+        self._built = False
+        self._lock = threading.Lock()
+        functools.update_wrapper(self, factory)
+
+    def __call__(self) -> T:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._instance = self._factory()
+                    self._built = True
+        return self._instance
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def set(self, instance: T):
+        with self._lock:
+            self._instance = instance
+            self._built = True
+
+    def reset(self):
+        with self._lock:
+            self._instance = None
+            self._built = False
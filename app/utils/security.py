@@ -1,9 +1,13 @@
 from typing import Optional, Tuple
+import asyncio
 import jwt
 import logging
+import threading
+import time
+from collections import OrderedDict
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from app.core.clients import supabase_client
+from app.core.clients import get_supabase_client
 from app.services.auth_service import AuthService
 from app.schemas.user import UserResponse
 from app.core.config import settings
@@ -12,23 +16,111 @@ logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> UserResponse:
-    auth_service = AuthService(supabase_client)
-    user = auth_service.get_user_from_token(token)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return UserResponse(id=user.id, email=user.email, role=user.user_metadata.get("role", "user"))
-
-def get_current_active_user(current_user: UserResponse = Depends(get_current_user)) -> UserResponse:
+class TokenClaimsCache:
+    """
+    Caches decoded JWT claims by token until the token's `exp`, so repeat requests
+    skip signature verification entirely. Bounded, least recently used entries go first.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is None:
+                return None
+            if claims.get("exp", 0) <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def put(self, token: str, claims: dict):
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+
+token_claims_cache = TokenClaimsCache(max_entries=settings.AUTH_CLAIMS_CACHE_MAX_ENTRIES)
+
+def decode_access_token(token: str) -> dict:
+    """
+    Verifies a Supabase access token locally (HS256 with SUPABASE_JWT_SECRET) and returns its claims.
+    Claims are cached until the token expires. Raises jwt.PyJWTError if the token is invalid or expired.
+    """
+    claims = token_claims_cache.get(token)
+    if claims is not None:
+        return claims
+    claims = jwt.decode(
+        token,
+        settings.SUPABASE_JWT_SECRET,
+        algorithms=["HS256"],
+        options={"verify_exp": True, "verify_aud": True, "require": ["exp", "sub"]},
+        audience="authenticated"
+    )
+    token_claims_cache.put(token, claims)
+    return claims
+
+async def _verify_with_supabase(token: str) -> bool:
+    """Asks Supabase whether the token is still valid (e.g. the session was not revoked)."""
+    auth_service = AuthService(get_supabase_client())
+    if await asyncio.to_thread(auth_service.get_user_from_token, token):
+        return True
+    token_claims_cache.discard(token)
+    return False
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserResponse:
+    """
+    Resolves the current user from locally verified JWT claims.
+    Supabase is only contacted when AUTH_REMOTE_VERIFY is enabled (revocation checks).
+    """
+    try:
+        claims = decode_access_token(token)
+    except jwt.PyJWTError as e:
+        logger.warning(f"Rejected access token: {e}")
+        raise _credentials_exception()
+
+    if settings.AUTH_REMOTE_VERIFY and not await _verify_with_supabase(token):
+        raise _credentials_exception()
+
+    user_metadata = claims.get("user_metadata") or {}
+    return UserResponse(id=claims["sub"], email=claims.get("email"), role=user_metadata.get("role", "user"))
+
+async def get_verified_current_user(token: str = Depends(oauth2_scheme)) -> UserResponse:
+    """Like `get_current_user`, but always confirms with Supabase that the session is still valid."""
+    current_user = await get_current_user(token)
+    if not settings.AUTH_REMOTE_VERIFY and not await _verify_with_supabase(token):
+        raise _credentials_exception()
+    return current_user
+
+async def get_current_active_user(current_user: UserResponse = Depends(get_current_user)) -> UserResponse:
     # Add logic here if you need to check if a user is active (e.g., email confirmed)
     return current_user
 
-def has_role(required_roles: list[str]):
-    def role_checker(current_user: UserResponse = Depends(get_current_active_user)):
+def has_role(required_roles: list[str], verify_remote: bool = False):
+    """
+    Dependency factory that requires one of `required_roles`.
+    Set `verify_remote` for endpoints that must also reject revoked sessions.
+    """
+    user_dependency = get_verified_current_user if verify_remote else get_current_active_user
+
+    # async so the check runs on the event loop instead of hopping to the threadpool
+    async def role_checker(current_user: UserResponse = Depends(user_dependency)):
         if current_user.role not in required_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -53,13 +145,7 @@ async def get_optional_current_user_context(request: Request) -> Tuple[Optional[
     token_string = auth_header.split(" ")[-1]
     
     try:
-        payload = jwt.decode(
-            token_string,
-            settings.SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            options={"verify_exp": True, "verify_aud": True},
-            audience="authenticated"
-        )
+        payload = decode_access_token(token_string)
         user_id = payload.get("sub") # "sub" claim usually holds the user ID (UID)
         return user_id, token_string
     except jwt.ExpiredSignatureError:
@@ -0,0 +1,26 @@
+import functools
+import logging
+from typing import Optional
+
+from app.core.config import settings
+
+CHARS_PER_TOKEN = 4  # Rough average used when no tokenizer is available
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding() -> Optional["tiktoken.Encoding"]:
+    """Loads the tiktoken encoding once. Returns None (with a warning) if it can't be loaded, e.g. offline."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+    except Exception as e:
+        logging.warning(f"Could not load tokenizer '{settings.TOKENIZER_ENCODING}', estimating tokens from length instead: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in `text` for the chat model's tokenizer."""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
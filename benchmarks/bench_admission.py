@@ -0,0 +1,126 @@
+"""
+Traffic spike against a quota-limited chat deployment, with and without admission control.
+
+QuotaChatModel stands in for an Azure OpenAI deployment that serves at most
+`--quota` concurrent calls; calls beyond that fail with a 429 after the usual
+latency, like a deployment over its TPM/RPM limit. The spike is one heavy user
+firing `--heavy` questions at once plus `--light` other users (half signed in,
+half anonymous sessions) asking one question each over `--spread` seconds.
+
+Without admission control every request goes straight to the model and the
+overflow fails slowly. With it, calls wait their turn (round-robin per user), the
+heavy user's excess is rejected immediately with a Retry-After, and the model
+never sees more calls than it can serve.
+
+Usage:
+    python -m benchmarks.bench_admission [--quota 8] [--heavy 40] [--light 30] [--spread 2]
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+from benchmarks.fakes import FakeChatModel, FakeEmbedder, FakeHistoryService, FakeRetriever
+
+from app.core.admission import AdmissionController
+from app.core.clients import get_azure_embedder, get_azure_llm, get_llm_admission
+from app.core.config import settings
+
+
+class QuotaChatModel(FakeChatModel):
+    quota: int = 8
+    running: int = 0
+    peak: int = 0
+
+    async def _agenerate(self, *args, **kwargs):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            if self.running > self.quota:
+                await asyncio.sleep(self.latency)
+                raise RuntimeError("429 Too Many Requests: rate limit exceeded for this deployment.")
+            return await super()._agenerate(*args, **kwargs)
+        finally:
+            self.running -= 1
+
+
+async def run(rag, llm: QuotaChatModel, admission: AdmissionController, args) -> Dict[str, dict]:
+    rag.llm_admission = admission
+    llm.peak = 0
+    rng = random.Random(args.seed)
+
+    async def one(group: str, user_id, session_id: str, delay: float, n: int):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            await rag.aget_answer(f"pertanyaan nomor {n} tentang jadwal {group}?", session_id=session_id, user_id=user_id)
+            outcome = "ok"
+        except HTTPException as e:
+            outcome = f"{e.status_code} (Retry-After {e.headers['Retry-After']})" if e.headers else str(e.status_code)
+        except Exception:
+            outcome = "model error"
+        return group, outcome, time.perf_counter() - start
+
+    calls = [one("heavy", "heavy-user", f"heavy-{n}", 0.0, n) for n in range(args.heavy)]
+    for n in range(args.light):
+        user_id = f"user-{n}" if n % 2 == 0 else None
+        calls.append(one("light", user_id, f"light-{n}", rng.uniform(0, args.spread), n))
+    results = await asyncio.gather(*calls)
+
+    report: Dict[str, dict] = {}
+    for group, outcome, seconds in results:
+        entry = report.setdefault(group, {"outcomes": {}, "ok": [], "failed": []})
+        entry["outcomes"][outcome.split(" (")[0]] = entry["outcomes"].get(outcome.split(" (")[0], 0) + 1
+        (entry["ok"] if outcome == "ok" else entry["failed"]).append(seconds)
+    report["peak"] = llm.peak
+    return report
+
+
+def _ms(values: List[float], p: float) -> str:
+    if not values:
+        return f"{'-':>9}"
+    values = sorted(values)
+    return f"{values[min(len(values) - 1, int(len(values) * p))] * 1000:>9.0f}"
+
+
+async def main(args):
+    llm = QuotaChatModel(latency=0.5, tokens_per_second=60, quota=args.quota)
+    get_azure_llm.set(llm)
+    get_azure_embedder.set(FakeEmbedder(latency=0.03))
+    settings.ANSWER_CACHE_ENABLED = False
+    settings.COALESCE_IDENTICAL_QUERIES = False
+    from app.services.rag_service import get_rag_service
+    rag = get_rag_service()
+    rag.retriever = FakeRetriever(latency=0.05)
+    rag.history_service = FakeHistoryService(latency=0.01)
+
+    controllers = {
+        "off": AdmissionController("llm", max_concurrency=10_000, max_tokens=10**9, max_queue=10_000, max_queue_per_key=10_000, queue_timeout=60),
+        "on": AdmissionController(
+            "llm", max_concurrency=args.quota, max_tokens=get_llm_admission().max_tokens, max_queue=settings.ADMISSION_QUEUE_MAX,
+            max_queue_per_key=settings.ADMISSION_QUEUE_MAX_PER_CLIENT, queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        ),
+    }
+    print(f"Deployment quota {args.quota} concurrent calls; 1 user x {args.heavy} questions at once + {args.light} users x 1 over {args.spread}s\n")
+    print(f"{'admission':<11}{'group':<7}{'ok':>5}{'ok p50':>9}{'ok p95':>9}{'fail p50':>10}  outcomes")
+    for name, controller in controllers.items():
+        report = await run(rag, llm, controller, args)
+        for group in ("heavy", "light"):
+            entry = report[group]
+            outcomes = ", ".join(f"{outcome} x{count}" for outcome, count in sorted(entry["outcomes"].items()))
+            print(f"{name:<11}{group:<7}{len(entry['ok']):>5}{_ms(entry['ok'], 0.5)}{_ms(entry['ok'], 0.95)} {_ms(entry['failed'], 0.5)}  {outcomes}")
+        print(f"{'':<11}peak concurrent model calls: {report['peak']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quota", type=int, default=8, help="Concurrent calls the fake deployment serves before failing with 429.")
+    parser.add_argument("--heavy", type=int, default=40, help="Questions the heavy user sends at once.")
+    parser.add_argument("--light", type=int, default=30, help="Other users, one question each.")
+    parser.add_argument("--spread", type=float, default=2.0, help="Seconds over which the other users arrive.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args))
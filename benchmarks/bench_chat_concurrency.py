@@ -0,0 +1,71 @@
+"""
+Concurrency benchmark for POST /api/v1/chat.
+
+Drives the FastAPI app in-process with fake retrieval, LLM and history backends
+and reports requests/second for increasing numbers of in-flight requests. The
+`blocking` rows emulate the old synchronous path, where every remote call froze
+the event loop.
+
+Usage:
+    python -m benchmarks.bench_chat_concurrency
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeChain, FakeEmbedder, FakeHistoryService, FakeRetriever
+
+from app.main import app
+from app.services.rag_service import get_rag_service
+from app.services.chat_history_service import get_chat_history_service
+
+
+def _install_fakes(blocking: bool, retrieval_latency: float, llm_latency: float, history_latency: float):
+    history = FakeHistoryService(latency=history_latency, blocking=blocking)
+    rag_service_instance = get_rag_service()
+    rag_service_instance.embedder = FakeEmbedder(latency=0, blocking=blocking)
+    # Every request asks something different, but keep the answer cache out of the measurement.
+    rag_service_instance.answer_cache.invalidate()
+    rag_service_instance.retriever = FakeRetriever(latency=retrieval_latency, blocking=blocking)
+    rag_service_instance.rag_chain = FakeChain(latency=llm_latency, blocking=blocking)
+    rag_service_instance.history_service = history
+    get_chat_history_service().aenqueue_message = history.aenqueue_message
+
+
+async def _run_level(client: httpx.AsyncClient, concurrency: int, total: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            response = await client.post("/api/v1/chat", json={"query": f"pertanyaan {i}"})
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(levels, requests_per_level: int, args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'mode':<10}{'in-flight':>10}{'req/s':>12}")
+        for blocking in (True, False):
+            _install_fakes(blocking, args.retrieval_latency, args.llm_latency, args.history_latency)
+            for concurrency in levels:
+                # The blocking path serializes everything, so keep its runs short.
+                total = min(concurrency, 16) if blocking else max(concurrency * 2, requests_per_level)
+                rps = await _run_level(client, concurrency, total)
+                print(f"{'blocking' if blocking else 'async':<10}{concurrency:>10}{rps:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 128, 256])
+    parser.add_argument("--requests", type=int, default=64, help="Minimum requests per async level.")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--history-latency", type=float, default=0.02)
+    args = parser.parse_args()
+    asyncio.run(main(args.levels, args.requests, args))
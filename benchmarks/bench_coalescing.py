@@ -0,0 +1,86 @@
+"""
+Burst of identical questions, with and without single-flight coalescing.
+
+Simulates an announcement: `--burst` new sessions ask the same question (in
+slightly different casing/spacing) within `--spread` seconds. Reports chat model
+calls, retrievals and latency for RAGService.aget_answer with
+COALESCE_IDENTICAL_QUERIES off and on. The semantic answer cache is cleared
+between runs; it only helps requests that arrive after the first answer is done.
+
+Usage:
+    python -m benchmarks.bench_coalescing [--burst 50] [--spread 0.5]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from benchmarks.fakes import FakeChatModel, FakeEmbedder, FakeHistoryService, FakeRetriever
+
+from app.core.clients import get_azure_embedder, get_azure_llm
+from app.core.config import settings
+
+
+class CountingChatModel(FakeChatModel):
+    calls: int = 0
+
+    async def _agenerate(self, *args, **kwargs):
+        self.calls += 1
+        return await super()._agenerate(*args, **kwargs)
+
+
+class CountingRetriever(FakeRetriever):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def _docs(self, query: str):
+        # Like a real index, the same chunks come back however the question is cased or spaced.
+        return super()._docs(" ".join(query.casefold().split()))
+
+    async def ainvoke(self, query: str, *args, **kwargs):
+        self.calls += 1
+        return await super().ainvoke(query, *args, **kwargs)
+
+
+async def run(rag, llm: CountingChatModel, burst: int, spread: float, coalesce: bool, seed: int):
+    settings.COALESCE_IDENTICAL_QUERIES = coalesce
+    rag.answer_cache.invalidate()
+    rag.retriever = retriever = CountingRetriever(latency=0.05)
+    llm.calls = 0
+    rng = random.Random(seed)
+    variants = ["Kapan pendaftaran wisuda dibuka?", "kapan pendaftaran wisuda dibuka?", "Kapan  pendaftaran wisuda dibuka? "]
+
+    async def one(i: int) -> float:
+        await asyncio.sleep(rng.uniform(0, spread))
+        start = time.perf_counter()
+        await rag.aget_answer(rng.choice(variants), session_id=f"burst-{coalesce}-{i}")
+        return time.perf_counter() - start
+
+    latencies = sorted(await asyncio.gather(*(one(i) for i in range(burst))))
+    return llm.calls, retriever.calls, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+async def main(burst: int, spread: float, seed: int):
+    llm = CountingChatModel(latency=0.6, tokens_per_second=60)
+    get_azure_llm.set(llm)
+    get_azure_embedder.set(FakeEmbedder(latency=0.03))
+    from app.services.rag_service import get_rag_service
+    rag = get_rag_service()
+    rag.history_service = FakeHistoryService(latency=0.01)
+
+    print(f"{burst} identical questions from new sessions within {spread}s\n")
+    print(f"{'coalescing':<12}{'LLM calls':>10}{'retrievals':>12}{'p50 ms':>9}{'p95 ms':>9}")
+    for coalesce in (False, True):
+        llm_calls, retrievals, p50, p95 = await run(rag, llm, burst, spread, coalesce, seed)
+        print(f"{'on' if coalesce else 'off':<12}{llm_calls:>10}{retrievals:>12}{p50 * 1000:>9.0f}{p95 * 1000:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=0.5, help="Seconds over which the burst arrives.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main(args.burst, args.spread, args.seed))
@@ -0,0 +1,101 @@
+"""
+Measures how much the context packer shrinks the prompt context.
+
+Splits a few synthetic handbook pages with the ingestion splitter (300 chars, 50
+overlap), then simulates a retrieval that returns runs of neighbouring chunks
+from the same page plus a verbatim copy of a chunk under a second source, which
+is what the top 8 typically look like for a focused question. Compares prompt
+context tokens and formatting time of the old verbatim concatenation with the
+packed context, and checks that every source page the retrieval returned is
+still attributed (apart from the duplicate copy) unless the budget forced it out.
+
+Usage:
+    python -m benchmarks.bench_context_packing [--budget 1500] [--trials 200]
+"""
+import argparse
+import random
+import time
+
+import benchmarks.fakes  # noqa: F401  (fills in dummy settings)
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from app.services.context_packer import ContextPacker
+from app.utils.tokens import _encoding, count_tokens
+
+SENTENCES = [
+    "Pendaftaran mahasiswa baru Fakultas Teknik dibuka setiap bulan Mei sampai Juli.",
+    "Calon mahasiswa mengunggah ijazah, transkrip nilai dan pas foto melalui portal penerimaan.",
+    "Program Studi Teknik Informatika menawarkan peminatan rekayasa perangkat lunak dan jaringan.",
+    "Biaya kuliah dibayarkan per semester melalui bank mitra universitas.",
+    "Mahasiswa wajib menempuh 144 SKS termasuk kerja praktik dan tugas akhir.",
+    "Laboratorium komputer dibuka pukul 08.00 hingga 16.00 pada hari kerja.",
+    "Beasiswa prestasi diberikan kepada mahasiswa dengan IPK minimal 3,50.",
+    "Jadwal ujian akhir semester diumumkan dua minggu sebelum pelaksanaan.",
+]
+
+
+def old_format(docs) -> str:
+    """The context formatting used before packing: every chunk verbatim."""
+    return "\n\n".join(ContextPacker.format_block(doc) for doc in docs)
+
+
+def build_retrievals(trials: int, seed: int = 3):
+    rng = random.Random(seed)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50)
+    pages = []
+    for source in ("panduan_akademik.pdf", "brosur_pmb.pdf", "peraturan_fakultas.pdf"):
+        for page in range(1, 6):
+            text = " ".join(rng.choice(SENTENCES) + f" (ketentuan {page}.{i})" for i in range(12))
+            pages.append(splitter.split_documents([Document(page_content=text, metadata={"source": source, "page": page})]))
+
+    retrievals = []
+    for _ in range(trials):
+        docs = []
+        while len(docs) < 7:
+            chunks = rng.choice(pages)
+            start = rng.randrange(len(chunks))
+            docs.extend(chunks[start:start + rng.randint(2, 3)])
+        docs = docs[:7]
+        copy = docs[0]
+        docs.append(Document(page_content=copy.page_content, metadata={"source": "arsip_lama.pdf", "page": copy.metadata["page"]}))
+        retrievals.append(docs)
+    return retrievals
+
+
+def main(budget: int, trials: int):
+    tokenizer = "tiktoken" if _encoding() is not None else "length estimate (tokenizer unavailable)"
+    retrievals = build_retrievals(trials)
+    packer = ContextPacker(token_budget=budget)
+
+    old_tokens = new_tokens = 0
+    old_seconds = new_seconds = 0.0
+    pages_before = pages_after = 0
+    for docs in retrievals:
+        start = time.perf_counter()
+        old = old_format(docs)
+        old_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        packed = packer.pack(docs)
+        new = packer.format(packed)
+        new_seconds += time.perf_counter() - start
+        old_tokens += count_tokens(old)
+        new_tokens += count_tokens(new)
+        # The copy under arsip_lama.pdf is identical text, so it is expected to be dropped.
+        pages_before += len({(d.metadata["source"], d.metadata["page"]) for d in docs[:-1]})
+        pages_after += len({(d.metadata["source"], d.metadata["page"]) for d in packed})
+
+    print(f"{trials} retrievals of 8 chunks, budget {budget} tokens, counting with {tokenizer}\n")
+    print(f"verbatim  {old_tokens / trials:7.1f} tokens/turn   {old_seconds / trials * 1e6:7.1f}us/turn")
+    print(f"packed    {new_tokens / trials:7.1f} tokens/turn   {new_seconds / trials * 1e6:7.1f}us/turn")
+    print(f"\ncontext tokens saved: {1 - new_tokens / old_tokens:.1%}")
+    print(f"source pages attributed: {pages_after / trials:.2f} of {pages_before / trials:.2f} retrieved per turn")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--trials", type=int, default=200)
+    args = parser.parse_args()
+    main(args.budget, args.trials)
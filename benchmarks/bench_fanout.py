@@ -0,0 +1,70 @@
+"""
+Checks that retrieval and history loading overlap in RAGService.aget_answer.
+
+Uses slow fake backends and compares the measured time to prepare a turn with the
+sum and the maximum of the two stage latencies. Also exercises the per-stage
+timeouts: a history backend slower than HISTORY_TIMEOUT_SECONDS must degrade to
+an empty history, and a retriever slower than RETRIEVAL_TIMEOUT_SECONDS must fail
+fast with 504. Exits non-zero if any check fails.
+
+Usage:
+    python -m benchmarks.bench_fanout
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from fastapi import HTTPException
+
+from benchmarks.fakes import FakeChain, FakeEmbedder, FakeHistoryService, FakeRetriever
+
+from app.core.config import settings
+from app.services.rag_service import get_rag_service
+
+rag = get_rag_service()
+
+
+async def _timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+async def main(retrieval_latency: float, history_latency: float) -> bool:
+    rag.embedder = FakeEmbedder(latency=0)
+    rag.rag_chain = FakeChain(latency=0)
+    rag.retriever = FakeRetriever(latency=retrieval_latency)
+    rag.history_service = FakeHistoryService(latency=history_latency)
+    settings.ANSWER_CACHE_ENABLED = False
+    ok = True
+
+    elapsed = await _timed(rag.aget_answer("jadwal pendaftaran", session_id="fanout"))
+    serial, overlapped = retrieval_latency + history_latency, max(retrieval_latency, history_latency)
+    print(f"retrieval {retrieval_latency * 1000:.0f}ms + history {history_latency * 1000:.0f}ms: "
+          f"took {elapsed * 1000:.0f}ms (serial {serial * 1000:.0f}ms, overlapped {overlapped * 1000:.0f}ms)")
+    if elapsed >= serial * 0.9:
+        print("FAIL: stages did not overlap")
+        ok = False
+
+    settings.HISTORY_TIMEOUT_SECONDS = history_latency / 2
+    elapsed = await _timed(rag.aget_answer("jadwal pendaftaran", session_id="fanout"))
+    print(f"history timeout {settings.HISTORY_TIMEOUT_SECONDS * 1000:.0f}ms: answered in {elapsed * 1000:.0f}ms without history")
+
+    settings.RETRIEVAL_TIMEOUT_SECONDS = retrieval_latency / 2
+    try:
+        elapsed = await _timed(rag.aget_answer("jadwal pendaftaran", session_id="fanout"))
+        print("FAIL: retrieval timeout did not trigger")
+        ok = False
+    except HTTPException as e:
+        print(f"retrieval timeout {settings.RETRIEVAL_TIMEOUT_SECONDS * 1000:.0f}ms: HTTP {e.status_code}")
+        ok = ok and e.status_code == 504
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retrieval-latency", type=float, default=0.3)
+    parser.add_argument("--history-latency", type=float, default=0.2)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args.retrieval_latency, args.history_latency)) else 1)
@@ -0,0 +1,104 @@
+"""
+Compares vector-only, BM25-only and hybrid (reciprocal rank fusion) retrieval.
+
+Builds a synthetic faculty corpus of near-identical course, lecturer and lab chunks
+that differ only in course codes, names and acronyms, indexes it in the local
+vector store and the BM25 index, and runs a labeled query set against each
+retriever. Reports recall@k and per-query latency (p50/p95). The fake embedder is
+a hashed bag of words, so absolute recall numbers are only meaningful relative to
+each other.
+
+Usage:
+    python -m benchmarks.bench_hybrid_retrieval [--courses 200] [--embed-latency 0.03]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.fakes import FakeEmbedder
+
+from app.services.hybrid_retriever import HybridRetriever
+from app.services.lexical_index import BM25Index
+from app.services.local_vector_store import LocalVectorStore
+from langchain_core.documents import Document
+
+TOPICS = ["algoritma", "basis data", "jaringan komputer", "kecerdasan buatan", "rekayasa perangkat lunak",
+          "sistem operasi", "statika", "mekanika tanah", "struktur beton", "rangkaian listrik"]
+FIRST_NAMES = ["Ahmad", "Baiq", "Lalu", "Siti", "Muhammad", "Nurul", "Rizki", "Dewi", "Hendra", "Putri"]
+LAST_NAMES = ["Hidayat", "Rahman", "Saputra", "Wulandari", "Maulana", "Fitriani", "Gunawan", "Susanti", "Pratama", "Hamdi"]
+FILLER = ("Mata kuliah ini membahas konsep dasar dan penerapan {topic} di bidang teknik. "
+          "Mahasiswa wajib mengikuti praktikum dan ujian akhir semester.")
+
+
+def build_corpus(courses: int, seed: int = 7):
+    rng = random.Random(seed)
+    docs, queries = [], []
+    for i in range(courses):
+        code = f"TIF-{2100 + i}"
+        lecturer = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {chr(65 + i % 26)}{i}"
+        topic = rng.choice(TOPICS)
+        doc_id = f"course-{i}"
+        docs.append(Document(id=doc_id, metadata={"source": "kurikulum.pdf"}, page_content=(
+            f"Mata kuliah {topic} dengan kode {code} diampu oleh {lecturer} pada semester {1 + i % 8}. "
+            + FILLER.format(topic=topic)
+        )))
+        queries.append((f"siapa dosen pengampu {code}?", doc_id))
+        queries.append((f"mata kuliah apa yang diajar {lecturer.split()[-1]}", doc_id))
+    for i in range(courses // 4):
+        acronym = f"LAB{chr(65 + i % 26)}{chr(65 + (i // 26) % 26)}"
+        doc_id = f"lab-{i}"
+        docs.append(Document(id=doc_id, metadata={"source": "fasilitas.pdf"}, page_content=(
+            f"Laboratorium {acronym} digunakan untuk praktikum mahasiswa teknik dan dibuka setiap hari kerja. "
+            "Peminjaman alat laboratorium harus melalui laboran."
+        )))
+        queries.append((f"di mana laboratorium {acronym}?", doc_id))
+    return docs, queries
+
+
+async def evaluate(name: str, retriever, queries, k: int):
+    latencies, hits = [], 0
+    for query, expected in queries:
+        start = time.perf_counter()
+        docs = await retriever.ainvoke(query)
+        latencies.append(time.perf_counter() - start)
+        hits += any((doc.metadata.get("id") or doc.id) == expected for doc in docs[:k])
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<8} recall@{k} {hits / len(queries):6.1%}   p50 {statistics.median(latencies) * 1000:6.2f}ms   p95 {p95 * 1000:6.2f}ms")
+
+
+class _LexicalOnly:
+    def __init__(self, index: BM25Index, k: int):
+        self.index, self.k = index, k
+
+    async def ainvoke(self, query: str):
+        return [doc for doc, _ in self.index.search(query, self.k)]
+
+
+async def main(courses: int, k: int, embed_latency: float):
+    docs, queries = build_corpus(courses)
+    embedder = FakeEmbedder(latency=0)
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(embedder, path)
+        store.add_texts([doc.page_content for doc in docs], [doc.metadata for doc in docs], ids=[doc.id for doc in docs])
+        lexical = BM25Index()
+        lexical.add(docs)
+        print(f"{len(docs)} chunks, {len(queries)} labeled queries, query embedding latency {embed_latency * 1000:.0f}ms\n")
+
+        embedder.latency = embed_latency
+        vector = store.as_retriever(k=k)
+        await evaluate("vector", vector, queries, k)
+        await evaluate("bm25", _LexicalOnly(lexical, k), queries, k)
+        await evaluate("hybrid", HybridRetriever(vector_retriever=vector, lexical_index=lexical, k=k), queries, k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Simulated query embedding latency in seconds.")
+    args = parser.parse_args()
+    asyncio.run(main(args.courses, args.k, args.embed_latency))
@@ -0,0 +1,220 @@
+"""
+Open-loop load test for POST /api/v1/chat, fully offline.
+
+Boots the real FastAPI app under uvicorn in a child process, wired to local
+stand-ins: FakeChatModel in place of Azure OpenAI chat (configurable latency and
+token rate), FakeEmbedder in place of the embedding deployment, the local vector
+store plus BM25 index seeded with a synthetic corpus in place of Azure AI Search,
+and FakePostgrestServer in place of Supabase. Everything between the HTTP socket
+and those stand-ins is production code.
+
+Requests arrive as a Poisson process at each offered rate, independent of how fast
+the server answers (open loop), and latency is measured from each request's
+scheduled send time, so queueing inside the server shows up instead of slowing the
+generator down. For every rate it reports throughput, p50/p95/p99 latency and the
+mean time per chat stage from /metrics.
+
+Usage:
+    python -m benchmarks.bench_load [--rates 5 10 20 40] [--duration 20] [--llm-latency 0.4]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.fakes import FakeChatModel, FakeEmbedder, FakePostgrestServer
+
+TOPICS = [
+    ("pendaftaran", "Pendaftaran mahasiswa baru dibuka melalui portal penerimaan dengan unggah ijazah dan transkrip nilai"),
+    ("beasiswa", "Beasiswa prestasi dan KIP Kuliah tersedia bagi mahasiswa dengan IPK minimal 3.00"),
+    ("ukt", "Uang kuliah tunggal dibayar setiap semester melalui bank mitra sebelum masa KRS"),
+    ("krs", "Pengisian kartu rencana studi dilakukan di SIAKAD setelah konsultasi dengan dosen wali"),
+    ("skripsi", "Pengajuan judul skripsi memerlukan minimal 110 SKS lulus dan persetujuan koordinator"),
+    ("wisuda", "Pendaftaran wisuda dibuka dua kali setahun setelah yudisium dan bebas pustaka"),
+    ("laboratorium", "Laboratorium komputer dan elektronika dapat dipinjam dengan surat permohonan ke kepala lab"),
+    ("akreditasi", "Program studi teknik informatika dan teknik elektro terakreditasi Baik Sekali"),
+    ("magang", "Kerja praktik atau magang wajib ditempuh minimal dua bulan di industri mitra"),
+    ("cuti", "Cuti akademik diajukan paling lambat dua minggu sebelum perkuliahan semester dimulai"),
+]
+
+
+def corpus(chunks_per_topic: int) -> List[Tuple[str, str, dict]]:
+    """Synthetic (id, text, metadata) chunks: each topic spread over several pages of its own guide."""
+    rows = []
+    for topic, sentence in TOPICS:
+        for i in range(chunks_per_topic):
+            text = f"{sentence}. Ketentuan {topic} bagian {i + 1} berlaku untuk angkatan {2018 + i % 7}. " * 3
+            rows.append((f"{topic}-{i}", text.strip(), {"source": f"panduan_{topic}.pdf", "page": i // 3, "page_label": str(i // 3 + 1)}))
+    return rows
+
+
+def question(rng: random.Random, n: int) -> str:
+    topic, sentence = rng.choice(TOPICS)
+    words = re.findall(r"\w+", sentence.lower())
+    return f"bagaimana ketentuan {topic} {' '.join(rng.sample(words, 3))} untuk angkatan {2018 + n % 7}?"
+
+
+# --- Server half (child process) ---
+
+def serve(args):
+    data_dir = tempfile.mkdtemp(prefix="bench-load-")
+    with FakePostgrestServer(latency=args.postgrest_latency) as postgrest:
+        os.environ.update({
+            "SUPABASE_URL": postgrest.url,
+            "VECTOR_STORE_BACKEND": "local",
+            "LOCAL_VECTOR_STORE_PATH": os.path.join(data_dir, "vector_store"),
+            "LEXICAL_INDEX_PATH": os.path.join(data_dir, "lexical_index.json"),
+            "INGEST_MANIFEST_PATH": os.path.join(data_dir, "ingest_manifest.json"),
+        })
+        # Swap in the stand-in models before anything builds the services that use them.
+        from app.core.clients import get_azure_embedder, get_azure_llm
+        get_azure_llm.set(FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tokens_per_second))
+        get_azure_embedder.set(FakeEmbedder(latency=args.embedding_latency))
+
+        import uvicorn
+        from langchain_core.documents import Document
+        from app.main import app
+        from app.services.rag_service import get_rag_service
+
+        rag = get_rag_service()
+        rows = corpus(args.chunks_per_topic)
+        rag.vector_store.add_texts([text for _, text, _ in rows], [metadata for _, _, metadata in rows], ids=[doc_id for doc_id, _, _ in rows])
+        rag.lexical_index.add(Document(id=doc_id, page_content=text, metadata=metadata) for doc_id, text, metadata in rows)
+        uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# --- Load generator half ---
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))]
+
+
+def stage_totals(metrics_text: str) -> Dict[str, List[float]]:
+    """{stage: [sum_seconds, count]} from the chat_stage_duration_seconds histogram."""
+    totals: Dict[str, List[float]] = {}
+    for kind, name, value in re.findall(r'^chat_stage_duration_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', metrics_text, re.M):
+        totals.setdefault(name, [0.0, 0.0])[0 if kind == "sum" else 1] = float(value)
+    return totals
+
+
+async def run_rate(client: httpx.AsyncClient, rate: float, duration: float, followup_ratio: float, rng: random.Random) -> dict:
+    schedule = []
+    at = rng.expovariate(rate)
+    while at < duration:
+        schedule.append(at)
+        at += rng.expovariate(rate)
+
+    sessions: List[str] = []
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def one(n: int, at: float):
+        if sessions and rng.random() < followup_ratio:
+            session_id = rng.choice(sessions)
+        else:
+            session_id = str(uuid.uuid4())
+            sessions.append(session_id)
+        await asyncio.sleep(max(0.0, start + at - loop.time()))
+        try:
+            response = await client.post("/api/v1/chat", json={"query": question(rng, n), "session_id": session_id})
+            outcome = response.status_code
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        return loop.time() - (start + at), loop.time() - start, outcome
+
+    before = stage_totals((await client.get("/metrics")).text)
+    results = await asyncio.gather(*(one(n, at) for n, at in enumerate(schedule)))
+    after = stage_totals((await client.get("/metrics")).text)
+
+    ok = sorted(latency for latency, _, outcome in results if outcome == 200)
+    errors: Dict[str, int] = {}
+    for _, _, outcome in results:
+        if outcome != 200:
+            errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+    elapsed = max((finished for _, finished, _ in results), default=duration)
+    stages = {
+        name: (total - before.get(name, [0.0, 0.0])[0]) / (count - before.get(name, [0.0, 0.0])[1])
+        for name, (total, count) in after.items()
+        if count > before.get(name, [0.0, 0.0])[1]
+    }
+    return {"sent": len(results), "ok": ok, "errors": errors, "throughput": len(ok) / elapsed, "stages": stages}
+
+
+async def drive(base_url: str, args):
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        # Warm-up: first-call costs (imports, tokenizer, connection pools) stay out of the numbers.
+        for n in range(5):
+            (await client.post("/api/v1/chat", json={"query": question(rng, n)})).raise_for_status()
+
+        print(f"{'offered/s':>10}{'sent':>7}{'ok':>7}{'errors':>8}{'ok/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for rate in args.rates:
+            result = await run_rate(client, rate, args.duration, args.followup_ratio, rng)
+            ok = result["ok"]
+            print(f"{rate:>10.1f}{result['sent']:>7}{len(ok):>7}{sum(result['errors'].values()):>8}{result['throughput']:>8.1f}"
+                  + "".join(f"{percentile(ok, p) * 1000:>9.0f}" for p in (50, 95, 99, 100)))
+            if result["errors"]:
+                print(f"{'':>10}errors: " + ", ".join(f"{outcome} x{count}" for outcome, count in sorted(result["errors"].items())))
+            print(f"{'':>10}stages (mean ms): " + ", ".join(f"{name} {seconds * 1000:.1f}" for name, seconds in sorted(result["stages"].items())))
+
+
+def main(args):
+    command = [sys.executable, "-m", "benchmarks.bench_load", "--serve", "--port", str(args.port),
+               "--llm-latency", str(args.llm_latency), "--tokens-per-second", str(args.tokens_per_second),
+               "--embedding-latency", str(args.embedding_latency), "--postgrest-latency", str(args.postgrest_latency),
+               "--chunks-per-topic", str(args.chunks_per_topic)]
+    # The app logs every request at INFO; keep that cost in the server but out of the report.
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if server.poll() is not None:
+                sys.exit(f"Server exited with code {server.returncode}.")
+            try:
+                if httpx.get(f"{base_url}/ready", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                sys.exit("Server did not start within 60s.")
+            time.sleep(0.2)
+
+        print(f"LLM {args.llm_latency * 1000:.0f}ms to first token at {args.tokens_per_second:.0f} tokens/s, "
+              f"embedding {args.embedding_latency * 1000:.0f}ms, PostgREST {args.postgrest_latency * 1000:.0f}ms, "
+              f"{len(TOPICS) * args.chunks_per_topic} chunks, {args.duration:.0f}s per rate\n")
+        asyncio.run(drive(base_url, args))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=float, nargs="+", default=[5, 10, 20, 40], help="Offered load levels in requests/second.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of arrivals per rate.")
+    parser.add_argument("--followup-ratio", type=float, default=0.3, help="Share of requests that continue an earlier session.")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="Fake chat model time to first token (s).")
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--embedding-latency", type=float, default=0.03)
+    parser.add_argument("--postgrest-latency", type=float, default=0.005)
+    parser.add_argument("--chunks-per-topic", type=int, default=30)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    serve(args) if args.serve else main(args)
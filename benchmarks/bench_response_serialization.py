@@ -0,0 +1,97 @@
+"""
+Compares the size and serialization cost of chat responses before and after compact mode.
+
+"Before" is the previous response shape: full chunk text in every source plus
+`debug_info` with every retrieved document and the full prompt context, encoded
+by FastAPI's default JSONResponse. "After" is the compact default: deduplicated
+source/page/snippet sources, no debug info, encoded with ORJSONResponse. Both
+go through the same steps FastAPI runs for a `response_model` endpoint
+(model validation, jsonable_encoder, render).
+
+Usage:
+    python -m benchmarks.bench_response_serialization [--docs 8] [--iterations 2000]
+"""
+import argparse
+import time
+from typing import List, Optional
+
+import benchmarks.fakes  # noqa: F401  (fills in dummy settings)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from langchain_core.documents import Document
+from pydantic import BaseModel
+
+from app.schemas.chat import ChatResponse
+from app.services.context_packer import ContextPacker
+from app.services.rag_service import get_rag_service
+
+rag = get_rag_service()
+
+
+class OldSource(BaseModel):
+    source: str
+    content: str
+
+
+class OldChatResponse(BaseModel):
+    answer: str
+    sources: List[OldSource]
+    session_id: str
+    debug_info: Optional[dict] = None
+    cache_hit: bool = False
+
+
+def retrieved_docs(count: int) -> List[Document]:
+    text = ("Pendaftaran mahasiswa baru Fakultas Teknik Universitas Hamzanwadi dibuka setiap tahun "
+            "melalui portal penerimaan. Calon mahasiswa mengunggah ijazah dan transkrip nilai. ")
+    # Neighbouring chunks share pages, as they do for a focused question.
+    return [
+        Document(id=f"chunk-{i}", page_content=f"{text * 2}(bagian {i})"[:300],
+                 metadata={"id": f"chunk-{i}", "source": "panduan_akademik.pdf", "page": i // 2, "page_label": str(i // 2 + 1)})
+        for i in range(count)
+    ]
+
+
+def old_payload(docs: List[Document], answer: str) -> dict:
+    return {
+        "answer": answer,
+        "sources": [{"source": doc.metadata["source"], "content": doc.page_content} for doc in docs],
+        "session_id": "3f0c2a9e-5f7e-4b8e-9a57-0a6f1d2b9c11",
+        "debug_info": {
+            "relevant_docs": [doc.model_dump() for doc in docs],
+            "context_string": "\n\n".join(ContextPacker.format_block(doc) for doc in docs),
+        },
+    }
+
+
+def new_payload(docs: List[Document], answer: str) -> dict:
+    return rag._build_response(answer, docs, "", "3f0c2a9e-5f7e-4b8e-9a57-0a6f1d2b9c11").model_dump()
+
+
+def measure(model, response_class, payload: dict, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = response_class(content=jsonable_encoder(model.model_validate(payload))).body
+    return (time.perf_counter() - start) / iterations, len(body)
+
+
+def main(docs_count: int, iterations: int):
+    docs = retrieved_docs(docs_count)
+    answer = "Pendaftaran dibuka pada bulan Mei sampai Juli melalui portal penerimaan mahasiswa baru. " * 3
+
+    old_seconds, old_bytes = measure(OldChatResponse, JSONResponse, old_payload(docs, answer), iterations)
+    new_seconds, new_bytes = measure(ChatResponse, ORJSONResponse, new_payload(docs, answer), iterations)
+
+    print(f"{docs_count} retrieved documents, {iterations} iterations\n")
+    print(f"before (full sources + debug_info, JSONResponse)  {old_bytes:6d} bytes  {old_seconds * 1e6:7.1f}us")
+    print(f"after  (compact sources, ORJSONResponse)          {new_bytes:6d} bytes  {new_seconds * 1e6:7.1f}us")
+    print(f"\n{old_bytes / new_bytes:.1f}x smaller, {old_seconds / new_seconds:.1f}x faster to serialize")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.docs, args.iterations)
@@ -0,0 +1,70 @@
+"""
+Per-call latency of chat history writes/reads against a local stand-in PostgREST server.
+
+Compares the old pattern (a fresh `create_client()` per call, authenticated with
+`postgrest.auth(token)`) with the pooled `SupabaseRestClient`, which keeps
+connections alive and sends the token as a per-request header.
+
+Usage:
+    python -m benchmarks.bench_supabase_pool
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.fakes import FakePostgrestServer
+
+from supabase import create_client
+
+from app.core.config import settings
+from app.core.supabase_rest import SupabaseRestClient
+
+TOKEN = settings.SUPABASE_KEY
+
+
+def _old_insert(url: str, row: dict):
+    client = create_client(url, settings.SUPABASE_KEY)
+    client.postgrest.auth(TOKEN)
+    client.table("chat_messages").insert(row).execute()
+
+
+def _old_select(url: str, session_id: str):
+    client = create_client(url, settings.SUPABASE_KEY)
+    client.postgrest.auth(TOKEN)
+    client.table("chat_messages").select("role, content").eq("session_id", session_id).order("created_at", desc=True).limit(5).execute()
+
+
+def _measure(fn, calls: int) -> list:
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _report(label: str, timings: list):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<22}{statistics.mean(timings):>10.2f}{statistics.median(timings):>10.2f}{p95:>10.2f}")
+
+
+def main(calls: int):
+    with FakePostgrestServer() as server:
+        pooled = SupabaseRestClient(server.url, settings.SUPABASE_KEY)
+        row = lambda i: {"session_id": "bench", "role": "user", "content": f"pesan {i}", "user_id": None}
+
+        print(f"{'ms per call':<22}{'mean':>10}{'p50':>10}{'p95':>10}")
+        _report("insert create_client", _measure(lambda i: _old_insert(server.url, row(i)), calls))
+        _report("insert pooled", _measure(lambda i: pooled.insert("chat_messages", row(i), access_token=TOKEN), calls))
+        _report("select create_client", _measure(lambda i: _old_select(server.url, "bench"), calls))
+        _report("select pooled", _measure(lambda i: pooled.select(
+            "chat_messages", columns="role,content,created_at", filters={"session_id": "eq.bench"},
+            order="created_at.desc", limit=5, access_token=TOKEN), calls))
+        pooled.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    main(parser.parse_args().calls)
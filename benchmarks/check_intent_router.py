@@ -0,0 +1,62 @@
+"""
+Regression check for the intent router's templated answers.
+
+Runs labelled queries through IntentRouter.classify and exits non-zero on any
+mismatch. The cases that must reach the RAG chain (expected None) are real
+faculty questions that use words which also appear in off-topic requests
+("skor" TOEFL, "slot" sidang, "presiden" BEM...); refusing those is worse than
+the LLM call a template would save. Add a case here for every misroute found.
+
+Usage:
+    python -m benchmarks.check_intent_router
+"""
+import sys
+
+import benchmarks.fakes  # noqa: F401  (fills in dummy settings)
+
+from app.services.intent_router import IntentRouter
+
+CASES = [
+    # Small talk
+    ("halo min", "greeting"),
+    ("Assalamualaikum kak", "greeting"),
+    ("makasih banyak ya", "thanks"),
+    ("oke, terima kasih", "thanks"),
+    # Clearly off-topic
+    ("resep nasi goreng kampung", "off_topic"),
+    ("siapa yang menang piala dunia 2022?", "off_topic"),
+    ("skor pertandingan liga inggris tadi malam", "off_topic"),
+    ("buatkan puisi tentang hujan", "off_topic"),
+    ("harga bitcoin hari ini berapa?", "off_topic"),
+    ("ramalan zodiak leo minggu ini", "off_topic"),
+    # Faculty questions with ambiguous words: must go to retrieval
+    ("Berapa skor TOEFL minimal untuk lulus?", None),
+    ("Berapa skor minimal ujian masuk?", None),
+    ("Kapan slot jadwal sidang skripsi dibuka?", None),
+    ("Siapa presiden BEM tahun ini?", None),
+    ("Bagaimana pemilu raya mahasiswa dilaksanakan?", None),
+    ("Apakah ada mata kuliah pembuatan film?", None),
+    ("Apakah ada UKM sepak bola di kampus?", None),
+    ("Bagaimana cara membuat stasiun cuaca untuk tugas akhir?", None),
+    ("Apa syarat ikut liga robotik?", None),
+    ("Berapa nilai minimal agar lulus praktikum?", None),
+    # Ordinary questions
+    ("Bagaimana cara mengisi KRS?", None),
+    ("Apa saja syarat pendaftaran wisuda?", None),
+]
+
+
+def main() -> int:
+    router = IntentRouter()
+    failures = 0
+    for query, expected in CASES:
+        got = router.classify(query)
+        if got != expected:
+            failures += 1
+            print(f"FAIL  {query!r}: expected {expected}, got {got}")
+    print(f"{len(CASES) - failures}/{len(CASES)} intent router cases passed.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+Offline stand-ins for the remote services used by the chat path.
+
+Importing this module fills in dummy values for any missing settings so that
+`app.main` can be imported without a `.env` file or network access.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+from typing import List, Optional, Dict
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_DUMMY_ENV = {
+    "AZURE_OPENAI_API_KEY": "bench",
+    "AZURE_OPENAI_ENDPOINT": "http://127.0.0.1:9",
+    "AZURE_OPENAI_API_VERSION": "2024-02-01",
+    "AZURE_OPENAI_DEPLOYMENT_NAME": "bench-embeddings",
+    "AZURE_OPENAI_CHAT_DEPLOYMENT_NAME": "bench-chat",
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    # create_client() only checks that the key looks like a JWT.
+    "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench",
+    "SUPABASE_JWT_SECRET": "bench-secret-bench-secret-bench-secret",
+    "AZURE_AI_SEARCH_ENDPOINT": "http://127.0.0.1:9",
+    "AZURE_AI_SEARCH_KEY": "bench",
+    "AZURE_AI_SEARCH_INDEX_NAME": "bench",
+    "USER_AGENT": "chatbotai-bench",
+}
+for _key, _value in _DUMMY_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+
+def _sleep(seconds: float, blocking: bool):
+    """Returns an awaitable that either yields to the loop or freezes it, like a sync client would."""
+    if blocking:
+        time.sleep(seconds)
+        return asyncio.sleep(0)
+    return asyncio.sleep(seconds)
+
+
+class FakeEmbedder(Embeddings):
+    """
+    Deterministic hashed bag-of-words embedder with a fixed per-call latency.
+    Texts sharing words get similar vectors, which is enough for cache and retrieval benchmarks.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.03, blocking: bool = False):
+        self.size = size
+        self.latency = latency
+        self.blocking = blocking
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.size] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        await _sleep(self.latency, self.blocking)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await _sleep(self.latency, self.blocking)
+        return [self._embed(text) for text in texts]
+
+
+class FakeRetriever:
+    """Retriever with a fixed latency that returns `k` canned documents."""
+
+    def __init__(self, latency: float = 0.05, k: int = 8, blocking: bool = False):
+        self.latency = latency
+        self.k = k
+        self.blocking = blocking
+
+    def _docs(self, query: str) -> List[Document]:
+        return [
+            Document(page_content=f"Potongan dokumen {i} untuk '{query}'.", metadata={"source": f"/tmp/doc_{i}.pdf", "page": i})
+            for i in range(self.k)
+        ]
+
+    def invoke(self, query: str, *args, **kwargs) -> List[Document]:
+        time.sleep(self.latency)
+        return self._docs(query)
+
+    async def ainvoke(self, query: str, *args, **kwargs) -> List[Document]:
+        await _sleep(self.latency, self.blocking)
+        return self._docs(query)
+
+
+class FakeChain:
+    """Stands in for `prompt | llm | StrOutputParser()` with a fixed generation latency."""
+
+    def __init__(self, latency: float = 0.2, answer: str = "Jawaban dari model palsu.", blocking: bool = False):
+        self.latency = latency
+        self.answer = answer
+        self.blocking = blocking
+
+    def invoke(self, inputs: dict, *args, **kwargs) -> str:
+        time.sleep(self.latency)
+        return self.answer
+
+    async def ainvoke(self, inputs: dict, *args, **kwargs) -> str:
+        await _sleep(self.latency, self.blocking)
+        return self.answer
+
+    async def astream(self, inputs: dict, *args, **kwargs):
+        tokens = self.answer.split(" ")
+        for i, token in enumerate(tokens):
+            await _sleep(self.latency / len(tokens), self.blocking)
+            yield token if i == 0 else f" {token}"
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with a canned text after `latency` seconds (time to first token),
+    then emits the answer word by word at `tokens_per_second`. Reports usage_metadata like
+    Azure OpenAI does, so it can replace `azure_llm` behind the real prompt and callbacks.
+    """
+
+    latency: float = 0.4
+    tokens_per_second: float = 50.0
+    answer: str = ("Pendaftaran mahasiswa baru Fakultas Teknik dibuka setiap bulan Mei sampai Juli melalui portal "
+                   "penerimaan. Silakan siapkan ijazah, transkrip nilai dan pas foto sebelum mendaftar.")
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self) -> List[str]:
+        words = self.answer.split(" ")
+        return [words[0]] + [f" {word}" for word in words[1:]]
+
+    def _usage(self, messages: List[BaseMessage]) -> dict:
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(self._tokens())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _duration(self) -> float:
+        return self.latency + len(self._tokens()) / self.tokens_per_second
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        time.sleep(self._duration())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer, usage_metadata=self._usage(messages)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._duration())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer, usage_metadata=self._usage(messages)))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for token in self._tokens():
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages)))
+
+
+class FakeHistoryService:
+    """In-memory chat history with a fixed per-call latency."""
+
+    def __init__(self, latency: float = 0.02, blocking: bool = False):
+        self.latency = latency
+        self.blocking = blocking
+        self.messages: Dict[str, List[Dict[str, str]]] = {}
+
+    def add_message(self, session_id: str, role: str, content: str, user_id: Optional[str] = None, access_token: Optional[str] = None):
+        time.sleep(self.latency)
+        self.messages.setdefault(user_id or session_id, []).append({"role": role, "content": content})
+
+    async def aadd_message(self, session_id: str, role: str, content: str, user_id: Optional[str] = None, access_token: Optional[str] = None):
+        await _sleep(self.latency, self.blocking)
+        self.messages.setdefault(user_id or session_id, []).append({"role": role, "content": content})
+
+    aenqueue_message = aadd_message
+
+    def get_history(self, session_id: str, user_id: Optional[str] = None, access_token: Optional[str] = None, limit: int = 5):
+        time.sleep(self.latency)
+        return self.messages.get(user_id or session_id, [])[-limit:]
+
+    async def aget_history(self, session_id: str, user_id: Optional[str] = None, access_token: Optional[str] = None, limit: int = 5):
+        await _sleep(self.latency, self.blocking)
+        return self.messages.get(user_id or session_id, [])[-limit:]
+
+
+class FakePostgrestServer:
+    """
+    Minimal stand-in for Supabase's PostgREST on a local port, served from a background thread.
+
+    Supports what ChatHistoryService uses: POST (single row or list), GET with `eq.`/`gte.`
+    filters, `order` and `limit`, and DELETE with `eq.` filters. Rows live in memory.
+    `latency` adds a fixed server-side delay per request.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        import json
+        import threading
+        from datetime import datetime, timezone
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import parse_qsl, urlsplit
+
+        self.tables: Dict[str, List[dict]] = {}
+        self.requests = 0
+        tables = self.tables
+        server = self
+
+        def matches(row: dict, filters: List[tuple]) -> bool:
+            for column, condition in filters:
+                op, _, value = condition.partition(".")
+                if op == "eq" and str(row.get(column)) != value:
+                    return False
+                if op == "gte" and str(row.get(column)) < value:
+                    return False
+            return True
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send headers and body in one segment; otherwise Nagle + delayed ACK adds ~40ms per reply.
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _parse(self):
+                server.requests += 1
+                if latency:
+                    time.sleep(latency)
+                parts = urlsplit(self.path)
+                table = parts.path.rsplit("/", 1)[-1]
+                params = [(k, v) for k, v in parse_qsl(parts.query) if k not in ("select", "order", "limit")]
+                options = dict(parse_qsl(parts.query))
+                return tables.setdefault(table, []), params, options
+
+            def _reply(self, code: int, payload=None):
+                body = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                rows, _, _ = self._parse()
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                for row in payload if isinstance(payload, list) else [payload]:
+                    row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                    rows.append(row)
+                self._reply(201)
+
+            def do_GET(self):
+                rows, filters, options = self._parse()
+                result = [row for row in rows if matches(row, filters)]
+                if "order" in options:
+                    column, _, direction = options["order"].partition(".")
+                    result.sort(key=lambda row: row.get(column, ""), reverse=direction == "desc")
+                if "limit" in options:
+                    result = result[: int(options["limit"])]
+                self._reply(200, result)
+
+            def do_DELETE(self):
+                rows, filters, _ = self._parse()
+                deleted = [row for row in rows if matches(row, filters)]
+                rows[:] = [row for row in rows if not matches(row, filters)]
+                self._reply(200, deleted)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()